@@ -0,0 +1,407 @@
+"""
+Headless benchmarks for importing the game, the simulation, collision checks, network activation,
+policy files, speciation, whole generations and decision intervals.
+
+Run it from the project directory:
+    python benchmark.py --json results.json
+
+Every result is printed as it is measured and all of them are written as JSON at the end,
+so runs on different commits can be compared.
+"""
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import pickle
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import neat
+import numpy as np
+
+import main
+
+# Folder of the game, so the benchmark runs from any working directory
+LOCAL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Populations the world step is measured at
+POPULATION_SIZES = [1, 200, 1000, 5000]
+
+# Populations speciation is measured at
+SPECIATION_SIZES = [200, 1000]
+
+# Decision intervals training is measured at
+DECISION_INTERVALS = [1, 2, 4, 8]
+
+def timeRepeated(function, minimumSeconds):
+    """
+    Call 'function' until at least 'minimumSeconds' have passed.
+    Returns the number of calls and the seconds they took.
+    """
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        function()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= minimumSeconds:
+            return calls, elapsed
+
+def loadConfig(configPath, speciesSet=None):
+    """
+    Load the NEAT configuration the same way main.run does, with the species set of the
+    'species_set' setting unless 'speciesSet' names one.
+    """
+    return main.loadConfig(configPath, speciesSet or main.loadSettings(configPath)['species_set'])
+
+def createGenomes(config, count, mutations=20):
+    """
+    Create 'count' genomes with some mutations each, so their networks have hidden nodes
+    like the ones seen a few generations into training.
+    """
+    genomes = []
+    for key in range(count):
+        genome = config.genome_type(key)
+        genome.configure_new(config.genome_config)
+        for _ in range(mutations):
+            genome.mutate(config.genome_config)
+        genomes.append(genome)
+    return genomes
+
+def steadyPolicy(observations):
+    """
+    A simple hand written policy that keeps most birds alive: jump when below the middle of the gap.
+    """
+    jump = observations[:, 0] > observations[:, 3] + 100
+    return np.column_stack((jump, np.zeros(len(jump), dtype=bool)))
+
+def benchmarkStep(birdCount, seconds, seed):
+    """
+    Measure world steps per second of FlappyEnv with 'birdCount' birds.
+    A new episode starts whenever every bird is dead.
+    """
+    env = main.FlappyEnv(birdCount)
+    observations = env.reset(seed)
+    ticks = 0
+    livingBirds = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        observations, _, dones = env.step(steadyPolicy(observations))
+        ticks += 1
+        livingBirds += np.count_nonzero(~dones)
+        if dones.all():
+            observations = env.reset(seed + ticks)
+    elapsed = time.perf_counter() - start
+    return {
+        'birds': birdCount,
+        'ticks': ticks,
+        'seconds': elapsed,
+        'ticksPerSecond': ticks / elapsed,
+        'birdTicksPerSecond': livingBirds / elapsed,
+        'meanLivingBirds': livingBirds / ticks
+    }
+
+def benchmarkImport(repeats=5):
+    """
+    Measure how long a fresh Python process takes to import the game, as a worker process does.
+    The fastest of 'repeats' runs is kept, and the startup of Python itself is subtracted.
+    """
+    def fastestRun(code):
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, cwd=LOCAL_DIR)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    return {
+        'importSeconds': fastestRun("import main") - fastestRun("pass")
+    }
+
+def benchmarkCollision(seconds, seed):
+    """
+    Measure wall collision checks per second, one bird at a time through wallCollideMask
+    and for a whole population through populationWallCollide.
+    """
+    rng = np.random.default_rng(seed)
+    streams = main.createRandomStreams(seed)
+    walls = [main.createWall(int(x), main.drawWallHeight(streams['walls'])) for x in rng.integers(100, 330, 64)]
+    birdCount = 1000
+    birdY = rng.uniform(0, 700, birdCount)
+    imageIndices = [int(rng.integers(main.BIRD_FLAP_COUNT)) for _ in birdY]
+
+    def checkBirds():
+        for wall in walls:
+            for imageIndex, y in zip(imageIndices[:16], birdY[:16]):
+                main.wallCollideMask(wall, imageIndex, 230, y)
+
+    calls, elapsed = timeRepeated(checkBirds, seconds)
+    singleChecks = calls * len(walls) * 16 / elapsed
+
+    population = main.createPopulation(birdCount, 230, 350)
+    population['y'] = birdY.copy()
+
+    def checkPopulation():
+        for wall in walls:
+            main.populationWallCollide(population, wall)
+
+    calls, elapsed = timeRepeated(checkPopulation, seconds)
+    return {
+        'wallCollideChecksPerSecond': singleChecks,
+        'populationWallCollideChecksPerSecond': calls * len(walls) * birdCount / elapsed
+    }
+
+def benchmarkActivation(config, seconds, seed):
+    """
+    Measure network activations per second of FeedForwardNetwork.activate against the batched
+    activateNetworks, for a population of the configured size, and the time it takes to build
+    the networks with and without NetworkCache.
+    """
+    random.seed(seed)
+    genomes = createGenomes(config, config.pop_size)
+    networks = [neat.nn.FeedForwardNetwork.create(genome, config) for genome in genomes]
+    inputs = np.random.default_rng(seed).uniform(0, 700, (len(networks), 6))
+    inputRows = inputs.tolist()
+
+    def activateOneByOne():
+        for network, networkInputs in zip(networks, inputRows):
+            network.activate(networkInputs)
+
+    calls, elapsed = timeRepeated(activateOneByOne, seconds)
+    singleRate = calls * len(networks) / elapsed
+
+    compiled = main.compileNetworks(networks)
+    calls, elapsed = timeRepeated(lambda: main.activateNetworks(compiled, inputs), seconds)
+    batchedRate = calls * len(networks) / elapsed
+
+    calls, elapsed = timeRepeated(lambda: main.compileNetworks(networks), seconds)
+    compileSeconds = elapsed / calls
+
+    calls, elapsed = timeRepeated(lambda: [neat.nn.FeedForwardNetwork.create(genome, config) for genome in genomes], seconds)
+    createSeconds = elapsed / calls
+
+    # Every genome is in the cache after the first call, like elites carried over to the next generation
+    cache = main.NetworkCache(len(genomes))
+    calls, elapsed = timeRepeated(lambda: [cache.create(genome, config) for genome in genomes], seconds)
+    return {
+        'networks': len(networks),
+        'feedForwardActivationsPerSecond': singleRate,
+        'batchedActivationsPerSecond': batchedRate,
+        'batchedSpeedup': batchedRate / singleRate,
+        'compileSeconds': compileSeconds,
+        'createSeconds': createSeconds,
+        'cachedCreateSeconds': elapsed / calls
+    }
+
+def benchmarkPolicy(config, seconds, seed):
+    """
+    Measure how long loading the network of a mutated genome from a policy file and from a pickle
+    takes, and how fast policy.py evaluates it for one observation and for a batch of 1000.
+    """
+    random.seed(seed)
+    genome = createGenomes(config, 1)[0]
+    network = neat.nn.FeedForwardNetwork.create(genome, config)
+    inputs = np.random.default_rng(seed).uniform(0, 700, (1000, 6))
+    inputRow = inputs[0].tolist()
+
+    with tempfile.TemporaryDirectory() as directory:
+        policyPath = os.path.join(directory, "genome.policy")
+        picklePath = os.path.join(directory, "genome.pkl")
+        main.exportPolicy(genome, config, policyPath)
+        with open(picklePath, "wb") as output:
+            pickle.dump(genome, output, 1)
+
+        calls, elapsed = timeRepeated(lambda: main.policy.loadPolicy(policyPath), seconds)
+        loadSeconds = elapsed / calls
+
+        def loadPickle():
+            with open(picklePath, "rb") as pickleFile:
+                neat.nn.FeedForwardNetwork.create(pickle.load(pickleFile), config)
+
+        calls, elapsed = timeRepeated(loadPickle, seconds)
+        pickleLoadSeconds = elapsed / calls
+        bird = main.policy.loadPolicy(policyPath)
+
+    calls, elapsed = timeRepeated(lambda: bird.activateOne(inputRow), seconds)
+    singleSeconds = elapsed / calls
+    calls, elapsed = timeRepeated(lambda: network.activate(inputRow), seconds)
+    feedForwardSeconds = elapsed / calls
+    calls, elapsed = timeRepeated(lambda: bird.activate(inputs), seconds)
+    return {
+        'nodes': len(network.node_evals),
+        'loadSeconds': loadSeconds,
+        'pickleLoadSeconds': pickleLoadSeconds,
+        'singleSeconds': singleSeconds,
+        'feedForwardSingleSeconds': feedForwardSeconds,
+        'batchedActivationsPerSecond': calls * len(inputs) / elapsed
+    }
+
+def benchmarkSpeciation(configPath, genomeCount, seconds, seed):
+    """
+    Measure how long DefaultSpeciesSet and VectorizedSpeciesSet take to divide 'genomeCount' genomes
+    into species, and check that they make the same species.
+    """
+    random.seed(seed)
+    configs = {name: loadConfig(configPath, name) for name in ('default', 'vectorized')}
+    population = {genome.key: genome for genome in createGenomes(configs['default'], genomeCount)}
+    result = {'genomes': genomeCount}
+    speciesSets = {}
+
+    for name, config in configs.items():
+        def speciate():
+            speciesSets[name] = config.species_set_type(config.species_set_config, neat.reporting.ReporterSet())
+            speciesSets[name].speciate(config, population, 0)
+
+        calls, elapsed = timeRepeated(speciate, seconds)
+        result[name + 'Seconds'] = elapsed / calls
+
+    result['species'] = len(speciesSets['default'].species)
+    result['speedup'] = result['defaultSeconds'] / result['vectorizedSeconds']
+    result['sameSpecies'] = speciesSets['default'].genome_to_species == speciesSets['vectorized'].genome_to_species
+    return result
+
+def benchmarkGenerations(config, generations, seed):
+    """
+    Measure the wall-clock time of each headless training generation, set up like main.run.
+    """
+    random.seed(seed)
+    main.generation = -1
+    population = neat.Population(config)
+    timings = []
+
+    def timedMain(genomes, config):
+        start = time.perf_counter()
+        main.main(genomes, config, headless=True)
+        timings.append(time.perf_counter() - start)
+
+    population.run(timedMain, generations)
+    return {
+        'generations': len(timings),
+        'secondsPerGeneration': timings,
+        'meanSecondsPerGeneration': sum(timings) / len(timings)
+    }
+
+def benchmarkDecisionInterval(config, interval, events, generations, seed):
+    """
+    Measure headless training generations with the networks asked every 'interval' ticks, and also
+    when new walls come into play and wind starts if 'events' is set. Every run starts from the same
+    seed, so the fitness shows how the interval changes what the population learns.
+    """
+    random.seed(seed)
+    main.generation = -1
+    settings = dict(main.DEFAULT_SETTINGS, decision_interval=interval, decision_events=events)
+    population = neat.Population(config)
+    timings = []
+    episodes = []
+
+    def timedMain(genomes, config):
+        reporter = main.EpisodeReporter()
+        start = time.perf_counter()
+        main.main(genomes, config, headless=True, settings=settings, episodes=reporter)
+        timings.append(time.perf_counter() - start)
+        episodes.extend(reporter.episodes)
+
+    population.run(timedMain, generations)
+    ticks = sum(episode['ticks'] for episode in episodes)
+    decisions = sum(episode['decisions'] for episode in episodes)
+    return {
+        'interval': interval,
+        'events': events,
+        'generations': len(timings),
+        'meanSecondsPerGeneration': sum(timings) / len(timings),
+        'ticksPerSecond': ticks / sum(timings),
+        'decisionShare': decisions / ticks,
+        'eventDecisions': sum(episode['eventDecisions'] for episode in episodes),
+        'bestFitness': population.best_genome.fitness
+    }
+
+def gitCommit():
+    """
+    Get the commit being benchmarked, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=LOCAL_DIR).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def report(name, result):
+    """
+    Print one benchmark result. Progress goes to standard error so the JSON can go to standard output.
+    """
+    print(name + ": " + ", ".join(f"{key}={value:.4g}" if isinstance(value, float) else f"{key}={value}"
+                                  for key, value in result.items() if not isinstance(value, list)), file=sys.stderr)
+
+def runBenchmarks(configPath, seconds, generations, seed, populationSizes, speciationSizes, decisionIntervals):
+    """
+    Run every benchmark and return all results in one dict.
+    """
+    config = loadConfig(configPath)
+    results = {
+        'commit': gitCommit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'seed': seed,
+        'step': [],
+        'speciation': [],
+        'decisionInterval': []
+    }
+
+    results['import'] = benchmarkImport()
+    report("import", results['import'])
+
+    for birdCount in populationSizes:
+        result = benchmarkStep(birdCount, seconds, seed)
+        report(f"step[{birdCount}]", result)
+        results['step'].append(result)
+
+    results['collision'] = benchmarkCollision(seconds, seed)
+    report("collision", results['collision'])
+
+    results['activation'] = benchmarkActivation(config, seconds, seed)
+    report("activation", results['activation'])
+
+    results['policy'] = benchmarkPolicy(config, seconds, seed)
+    report("policy", results['policy'])
+
+    for genomeCount in speciationSizes:
+        result = benchmarkSpeciation(configPath, genomeCount, seconds, seed)
+        report(f"speciation[{genomeCount}]", result)
+        results['speciation'].append(result)
+
+    if generations:
+        results['generation'] = benchmarkGenerations(config, generations, seed)
+        report("generation", results['generation'])
+
+        for interval in decisionIntervals:
+            for events in (False, True) if interval > 1 else (False,):
+                result = benchmarkDecisionInterval(config, interval, events, generations, seed)
+                report(f"decisionInterval[{interval}{', events' if events else ''}]", result)
+                results['decisionInterval'].append(result)
+
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Flappy Bird AI simulation headless.")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Minimum time spent on each measurement.")
+    parser.add_argument("--generations", type=int, default=5, help="Number of training generations to time, 0 to skip.")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the episodes, genomes and training run.")
+    parser.add_argument("--populations", type=int, nargs="+", default=POPULATION_SIZES, help="Population sizes for the world step benchmark.")
+    parser.add_argument("--speciation-populations", type=int, nargs="+", default=SPECIATION_SIZES, help="Population sizes for the speciation benchmark.")
+    parser.add_argument("--decision-intervals", type=int, nargs="+", default=DECISION_INTERVALS,
+                        help="Decision intervals to time training generations at, with and without event decisions.")
+    parser.add_argument("--json", help="Write the results as JSON to this file, or '-' for standard output.")
+    args = parser.parse_args()
+
+    results = runBenchmarks(os.path.join(LOCAL_DIR, "ConfigFile.txt"), args.seconds, args.generations, args.seed, args.populations, args.speciation_populations, args.decision_intervals)
+
+    if args.json == "-":
+        print(json.dumps(results, indent=2))
+    elif args.json:
+        with open(args.json, "w") as output:
+            json.dump(results, output, indent=2)
+        print(f"Results written to {args.json}", file=sys.stderr)
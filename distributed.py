@@ -0,0 +1,270 @@
+"""
+Evaluation over TCP on workers that connect from any number of hosts, behind main.py's
+'--coordinator HOST:PORT' and '--mode worker'.
+
+A Coordinator sends every worker the NEAT config and the game settings once, and then one job at
+a time: a list of genomes and the seed of the episode they play together. A worker answers every
+message, with ('ready',) for the config, ('result', jobId, fitness, episode) for a job and
+('error', traceback) when it fails, so the coordinator always knows which message went wrong.
+Messages travel as pickles, so only give the key to machines you trust.
+"""
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from multiprocessing.connection import Client, Listener
+
+# Port the coordinator listens on when the address has none
+COORDINATOR_PORT = 6000
+
+# Environment variable holding the key the coordinator and its workers authenticate each other with
+AUTHKEY_VARIABLE = "FLAPPY_AUTHKEY"
+
+# Number of times a job may fail on a worker or lose its worker before the generation fails
+JOB_ATTEMPTS = 3
+
+def parseAddress(address):
+    """
+    Split a 'host:port' string into the (host, port) tuple multiprocessing.connection uses.
+    A bare host gets COORDINATOR_PORT.
+    """
+    host, _, port = address.rpartition(':')
+    if not host:
+        return address, COORDINATOR_PORT
+    return host, int(port)
+
+def readAuthkey():
+    """
+    Read the key from the FLAPPY_AUTHKEY environment variable, or None when it is not set.
+    Jobs and results travel as pickles, so only give it to machines you trust.
+    """
+    key = os.environ.get(AUTHKEY_VARIABLE)
+    return key.encode() if key else None
+
+def runWorker(address, authkey, play, retrySeconds=5.0):
+    """
+    Evaluate jobs for the Coordinator listening at 'address' until it closes the connection.
+    'play(genomes, config, seed, settings)' plays one job and returns its fitness list and episode dict.
+    Until the coordinator is up, connecting is retried every 'retrySeconds'.
+    """
+    while True:
+        try:
+            connection = Client(address, authkey=authkey)
+            break
+        except ConnectionRefusedError:
+            print(f"No coordinator at {address[0]}:{address[1]} yet, retrying in {retrySeconds:g} sec")
+            time.sleep(retrySeconds)
+
+    # Every message gets one reply, so the coordinator knows which message an error belongs to
+    config = settings = None
+    with connection:
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                return
+            except Exception:
+                # A message this host cannot unpickle, for example from another version of the game
+                connection.send(('error', traceback.format_exc()))
+                continue
+            try:
+                if message[0] == 'config':
+                    _, config, settings = message
+                    reply = ('ready',)
+                else:
+                    _, jobId, genomes, seed = message
+                    fitness, episode = play(genomes, config, seed, settings)
+                    reply = ('result', jobId, fitness, episode)
+            except Exception:
+                reply = ('error', traceback.format_exc())
+            connection.send(reply)
+
+def runWorkers(address, authkey, play, count=1):
+    """
+    Run 'count' workers for the coordinator at 'address', each in its own process when there are several.
+    """
+    if count <= 1:
+        runWorker(address, authkey, play)
+        return
+    processes = [multiprocessing.Process(target=runWorker, args=(address, authkey, play)) for _ in range(count)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+class Coordinator:
+    """
+    Hand out jobs to the workers connecting to 'address' and collect their results, see runJobs.
+    A worker gets the config and 'settings' once and then one job at a time. The job of a worker
+    whose connection drops or that raises an error on the worker goes back in the queue, until it
+    has failed JOB_ATTEMPTS times and runJobs raises a RuntimeError. Once the queue is empty idle
+    workers also run a copy of any job that has been out for 'stragglerSeconds', keeping whichever
+    result comes back first.
+    Without an 'authkey' a random one is used, which only the 'localWorkers' worker processes
+    started on this machine get; they play the jobs with 'play' like runWorker.
+    """
+    def __init__(self, address, authkey=None, settings=None, play=None, stragglerSeconds=30.0, localWorkers=0):
+        self.settings = settings
+        self.stragglerSeconds = stragglerSeconds
+        if authkey is None:
+            authkey = os.urandom(32)
+            print(f"{AUTHKEY_VARIABLE} is not set, so only workers started with --workers can connect")
+        self.listener = Listener(address, authkey=authkey)
+        host, port = self.listener.address
+        self.address = f"{host}:{port}"
+        print(f"Coordinator listening on {self.address}")
+
+        self.condition = threading.Condition()
+        self.round = 0
+        self.config = None
+        self.jobs = {}
+        self.queued = deque()
+        self.started = {}
+        self.results = {}
+        self.failures = {}
+        self.error = None
+        self.workerCount = 0
+        self.closed = False
+
+        localAddress = ('127.0.0.1' if host in ('', '0.0.0.0') else host, port)
+        self.localWorkers = [multiprocessing.Process(target=runWorker, args=(localAddress, authkey, play), daemon=True) for _ in range(localWorkers)]
+        for process in self.localWorkers:
+            process.start()
+        threading.Thread(target=self.acceptWorkers, daemon=True).start()
+
+    def close(self):
+        """
+        Stop handing out jobs and disconnect the workers, which makes them exit.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.listener.close()
+        for process in self.localWorkers:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+
+    def acceptWorkers(self):
+        """
+        Serve every worker that connects in its own thread, until the coordinator is closed.
+        """
+        while not self.closed:
+            try:
+                connection = self.listener.accept()
+            except (multiprocessing.AuthenticationError, EOFError, OSError) as error:
+                if self.closed:
+                    return
+                print(f"A worker failed to connect: {error!r}")
+                continue
+            threading.Thread(target=self.serveWorker, args=(connection,), daemon=True).start()
+
+    def nextJob(self):
+        """
+        Take the next queued job or, when the queue is empty, the job out the longest once it has been out
+        for 'stragglerSeconds'. Returns None when there is nothing to do. Call with the condition held.
+        """
+        if self.queued:
+            return self.queued.popleft()
+        now = time.perf_counter()
+        stragglers = [(start, jobId) for jobId, start in self.started.items() if now - start >= self.stragglerSeconds]
+        if not stragglers:
+            return None
+        jobId = min(stragglers)[1]
+        # Another copy only goes out after a further 'stragglerSeconds'
+        self.started[jobId] = now
+        return jobId
+
+    def jobFailed(self, jobId, reason):
+        """
+        Put a job that failed on a worker, for 'reason', back in the queue, or fail the round
+        once the job has failed JOB_ATTEMPTS times. Call with the condition held.
+        """
+        if jobId not in self.jobs or jobId in self.results or jobId in self.queued:
+            return
+        self.started.pop(jobId, None)
+        self.failures[jobId] = self.failures.get(jobId, 0) + 1
+        if self.failures[jobId] >= JOB_ATTEMPTS:
+            self.error = f"Job {jobId} failed {self.failures[jobId]} times, the last time with: {reason}"
+        else:
+            self.queued.appendleft(jobId)
+        self.condition.notify_all()
+
+    def serveWorker(self, connection):
+        """
+        Send jobs to one worker and collect its results until it disconnects or the coordinator is closed.
+        """
+        jobId = None
+        sentConfig = None
+        with self.condition:
+            self.workerCount += 1
+            self.condition.notify_all()
+        try:
+            while True:
+                with self.condition:
+                    jobId = self.nextJob()
+                    while jobId is None and not self.closed:
+                        self.condition.wait(1.0)
+                        jobId = self.nextJob()
+                    if self.closed:
+                        return
+                    self.started.setdefault(jobId, time.perf_counter())
+                    genomes, seed = self.jobs[jobId]
+                    config = self.config
+                reply = ('ready',)
+                if config is not sentConfig:
+                    connection.send(('config', config, self.settings))
+                    reply = connection.recv()
+                    if reply[0] == 'ready':
+                        sentConfig = config
+                if reply[0] == 'ready':
+                    connection.send(('evaluate', jobId, genomes, seed))
+                    reply = connection.recv()
+                with self.condition:
+                    if reply[0] == 'error':
+                        print(f"Job {jobId} failed on a worker:\n{reply[1]}")
+                        self.jobFailed(jobId, reply[1].strip().splitlines()[-1])
+                    else:
+                        # Results of an earlier round or of a slower copy are dropped
+                        _, resultId, fitness, episode = reply
+                        if resultId in self.jobs and resultId not in self.results:
+                            self.results[resultId] = (fitness, episode)
+                            self.started.pop(resultId, None)
+                            self.condition.notify_all()
+                jobId = None
+        except (EOFError, OSError):
+            with self.condition:
+                self.jobFailed(jobId, "its worker was lost")
+            print("Lost a worker" + (", its job goes back in the queue" if jobId is not None else ""))
+        finally:
+            with self.condition:
+                self.workerCount -= 1
+            connection.close()
+
+    def runJobs(self, config, jobs):
+        """
+        Play 'jobs', a dict of job ids to (genomes, seed), on the workers with 'config', and return a dict
+        of job ids to their (fitness, episode). Waits for workers to connect while there are none.
+        """
+        with self.condition:
+            self.round += 1
+            self.config = config
+            # The round tells results of this call apart from late ones of the previous call
+            self.jobs = {(self.round, jobId): job for jobId, job in jobs.items()}
+            self.queued = deque(self.jobs)
+            self.started = {}
+            self.results = {}
+            self.failures = {}
+            self.error = None
+            self.condition.notify_all()
+            waiting = False
+            while len(self.results) < len(self.jobs):
+                if self.error:
+                    raise RuntimeError(self.error)
+                if not self.workerCount and not waiting:
+                    print(f"Waiting for workers to connect to {self.address}")
+                waiting = not self.workerCount
+                self.condition.wait(1.0)
+            return {jobId: result for (_, jobId), result in self.results.items()}
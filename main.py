@@ -1,152 +1,305 @@
-import pygame
 import random
+import argparse
+import gzip
+import itertools
+import json
+import queue
+import threading
+import configparser
+import csv
+import time
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
 import os
 import neat
 import pickle
-import matplotlib.pyplot as plt
+from collections import OrderedDict, deque
+import numpy as np
+import distributed
+import policy
+import replay
+import speciation
 
 # Constants defining the window size.
 WINDOW_WIDTH = 500
 WINDOW_HEIGHT = 800
 
-#constants to keep track of fitness threshold
-FITNESS_THRESHOLD = 10000
-
 # Global variable to keep track of the generations
 generation = -1
 
-# Load wind images from the images/wind directory
-WIND_IMAGES = []
-wind_dir = os.path.join("images", "wind")
-for filename in os.listdir(wind_dir):
-    if filename.endswith(".png"):  # Assuming all wind assets are PNG files
-        image_path = os.path.join(wind_dir, filename)
-        WIND_IMAGES.append(pygame.image.load(image_path))
-        
-# Load bird images and scale them up.
-BIRD_FLAPS = [
-    pygame.transform.scale2x(pygame.image.load(os.path.join("images", "flap1.png"))),
-    pygame.transform.scale2x(pygame.image.load(os.path.join("images", "flap2.png"))),
-    pygame.transform.scale2x(pygame.image.load(os.path.join("images", "flap3.png")))
-]
+# Game settings used when the [FlappyBird] section of the config file leaves them out
+DEFAULT_SETTINGS = {
+    'max_ticks': 0,
+    'max_score': 0,
+    'checkpoint_interval': 10,
+    'checkpoint_keep': 3,
+    'render_every': 1,
+    'display_fps': 0.0,
+    'replay_top_k': 0,
+    'replay_keep': 20,
+    'episodes_per_genome': 1,
+    'fitness_aggregation': 'mean',
+    'fitness_quantile': 0.25,
+    'telemetry_file': 'telemetry.jsonl',
+    'telemetry_max_bytes': 10000000,
+    'telemetry_backups': 5,
+    'straggler_seconds': 30.0,
+    'decision_interval': 1,
+    'decision_events': False,
+    'course_seed': 0,
+    'fitness_cache_size': 10000,
+    'species_set': 'default'
+}
+
+# Folder the training checkpoints are written to
+CHECKPOINT_DIR = "checkpoints"
+
+# Folder the replays of training generations are written to
+REPLAY_DIR = "replays"
+
+# Files the best genome is saved to, pickled and as a policy file for policy.py
+WINNER_PATH = "winner.pkl"
+POLICY_PATH = "winner.policy"
+
+
+# Folder the game images are loaded from
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+
+# Collision masks and sizes of the images, so the game can run without loading them
+COLLISION_METADATA_PATH = os.path.join(IMAGE_DIR, "collision_metadata.npz")
+
+# pygame is only imported and the images are only loaded by loadAssets, the first time something is drawn.
+pygame = None
+ASSETS = {}
+
+def loadAssets():
+    """
+    Import pygame and load and scale the game images, once. Returns the ASSETS dict.
+    Only drawing needs them; the game itself runs on the collision metadata.
+    """
+    global pygame
+    if ASSETS:
+        return ASSETS
+    import pygame
+
+    # Load wind images from the images/wind directory
+    windImages = []
+    windDir = os.path.join(IMAGE_DIR, "wind")
+    for filename in os.listdir(windDir):
+        if filename.endswith(".png"):  # Assuming all wind assets are PNG files
+            windImages.append(pygame.image.load(os.path.join(windDir, filename)))
+
+    # Load bird images and scale them up. The outline is shown during a high jump.
+    birdFlaps = [pygame.transform.scale2x(pygame.image.load(os.path.join(IMAGE_DIR, f"flap{number}.png"))) for number in (1, 2, 3)]
+    birdOutline = pygame.transform.scale(pygame.image.load(os.path.join(IMAGE_DIR, "birdOutline.png")), birdFlaps[0].get_size())
+
+    # Load and scale other game images: wall, Base (Ground), and Background.
+    wall = pygame.transform.scale2x(pygame.image.load(os.path.join(IMAGE_DIR, "wall.png")))
+    ASSETS.update({
+        'wind': windImages,
+        'birds': birdFlaps + [birdOutline],
+        'wall': wall,
+        'wallTop': pygame.transform.flip(wall, False, True),
+        'ground': pygame.transform.scale2x(pygame.image.load(os.path.join(IMAGE_DIR, "Ground.png"))),
+        'background': pygame.transform.scale2x(pygame.image.load(os.path.join(IMAGE_DIR, "background.png")))
+    })
+    return ASSETS
+
+def getImageMask(image):
+    """
+    Get the collision mask of an image as a boolean array indexed by [y, x].
+    """
+    mask = pygame.mask.from_surface(image)
+    width, height = mask.get_size()
+    return np.array([[mask.get_at((x, y)) for x in range(width)] for y in range(height)], dtype=bool)
 
-BIRD_OUTLINE_IMAGE = pygame.transform.scale(pygame.image.load(os.path.join("images", "birdOutline.png")), BIRD_FLAPS[0].get_size())
+def buildCollisionMetadata(path=COLLISION_METADATA_PATH):
+    """
+    Compute the collision masks and sizes the game needs from the images and save them to 'path'.
+    Run 'python main.py --build-collision-metadata' again after changing an image.
+    """
+    assets = loadAssets()
+    np.savez_compressed(
+        path,
+        birdMasks=np.array([getImageMask(image) for image in assets['birds']]),
+        flapCount=len(assets['birds']) - 1,
+        wallTopMask=getImageMask(assets['wallTop']),
+        wallBottomMask=getImageMask(assets['wall']),
+        groundWidth=assets['ground'].get_width()
+    )
 
-# Load and scale other game images: wall, Base (Ground), and Background.
-WALL_IMAGE = pygame.transform.scale2x(pygame.image.load(os.path.join("images", "wall.png")))
-Ground_IMAGE = pygame.transform.scale2x(pygame.image.load(os.path.join("images", "Ground.png")))
-BACKGROUND_IMAGE = pygame.transform.scale2x(pygame.image.load(os.path.join("images", "background.png")))
+def loadCollisionMetadata(path=COLLISION_METADATA_PATH):
+    """
+    Load the collision metadata, building it from the images first if the file is missing.
+    """
+    if not os.path.exists(path):
+        buildCollisionMetadata(path)
+    with np.load(path) as metadata:
+        return {key: metadata[key] for key in metadata.files}
+
+COLLISION_METADATA = loadCollisionMetadata()
+
+# Collision masks, indexed by [y, x]. Birds refer to their current image, and so to its mask, by index:
+# the flap images come first and the high jump outline last.
+BIRD_MASKS = COLLISION_METADATA['birdMasks']
+WALL_TOP_MASK = COLLISION_METADATA['wallTopMask']
+WALL_BOTTOM_MASK = COLLISION_METADATA['wallBottomMask']
+BIRD_FLAP_COUNT = int(COLLISION_METADATA['flapCount'])
+BIRD_OUTLINE_INDEX = BIRD_FLAP_COUNT
+BIRD_HEIGHT = BIRD_MASKS.shape[1]
+BIRD_WIDTH = BIRD_MASKS.shape[2]
+WALL_HEIGHT, WALL_WIDTH = WALL_BOTTOM_MASK.shape
+GROUND_WIDTH = int(COLLISION_METADATA['groundWidth'])
+
+def getMaskBounds(mask):
+    """
+    Get the (left, top, right, bottom) box around the set pixels of a mask.
+    An empty mask gets an empty box, which never overlaps anything.
+    """
+    rows = np.flatnonzero(mask.any(axis=1))
+    columns = np.flatnonzero(mask.any(axis=0))
+    if not len(rows):
+        return (0, 0, 0, 0)
+    return (int(columns[0]), int(rows[0]), int(columns[-1]) + 1, int(rows[-1]) + 1)
+
+# Boxes around the set pixels of each collision mask, for the cheap checks in wallCollideMask.
+BIRD_BOUNDS = np.array([getMaskBounds(mask) for mask in BIRD_MASKS])
+WALL_TOP_BOUNDS = getMaskBounds(WALL_TOP_MASK)
+WALL_BOTTOM_BOUNDS = getMaskBounds(WALL_BOTTOM_MASK)
 
 # Constants for bird movement
 MAX_ROTATION = 25
 ROTATION_VELOCITY = 20
 FRAME_DURATION_ANIMATION = 5
 
-# Bird functions
-def createBird(x, y):
+def loadSettings(configPath, **overrides):
     """
-    Create a bird with initial parameters.
+    Read the game settings from the [FlappyBird] section of the config file.
+    Overrides that are not None, such as command line options, win over the file.
     """
+    parser = configparser.ConfigParser()
+    parser.read(configPath)
+    settings = dict(DEFAULT_SETTINGS)
+    if parser.has_section('FlappyBird'):
+        for key in parser.options('FlappyBird'):
+            if key not in DEFAULT_SETTINGS:
+                raise ValueError(f"Unknown setting {key!r} in the [FlappyBird] section of {configPath}")
+            default = DEFAULT_SETTINGS[key]
+            if isinstance(default, bool):
+                settings[key] = parser.getboolean('FlappyBird', key)
+            elif isinstance(default, int):
+                settings[key] = parser.getint('FlappyBird', key)
+            elif isinstance(default, float):
+                settings[key] = parser.getfloat('FlappyBird', key)
+            else:
+                settings[key] = parser.get('FlappyBird', key)
+    settings.update((key, value) for key, value in overrides.items() if value is not None)
+    return settings
+
+# Random stream functions
+# An episode draws wall heights and wind events from two separate streams derived from one
+# episode seed, so it can be replayed bit for bit. Wind numbers are computed from the seed,
+# the bird's id and the tick instead of being drawn in sequence, which makes every bird's wind
+# independent of how many other birds are alive or which process simulates them.
+def createRandomStreams(seed=None):
+    """
+    Create the random streams of an episode. Without a seed a fresh one is picked
+    and kept in 'seed' so the episode can still be replayed.
+    """
+    seedSequence = np.random.SeedSequence(seed)
+    wallSeed, windSeed = seedSequence.generate_state(2, dtype=np.uint64)
     return {
-        'x': x,
-        'y': y,
-        'tilt': 0,
-        'tickCount': 0,
-        'velocity': 0,
-        'height': y,
-        'imageCount': 0,
-        'image': BIRD_FLAPS[0],
-        'displacement': 0,  # Initialize displacement
-        'windDisplacement': 0,  # Initialize wind displacement
-        'windActive': False,  # Initialize wind active
-        'windTimer': 0,  # Initialize wind timer
-        'highJumpActive': False  # Initialize high jump active
+        'seed': seedSequence.entropy,
+        'walls': random.Random(int(wallSeed)),
+        'wind': int(windSeed)
     }
 
-def birdJump(bird):
+def mixBits(value):
     """
-    Make the bird jump by setting its velocity upwards.
+    Scramble 64 bit integers with the splitmix64 finalizer. Works on NumPy uint64 arrays.
     """
-    bird['velocity'] = -11
-    bird['tickCount'] = 0
-    bird['height'] = bird['y']
+    value = value ^ (value >> np.uint64(30))
+    value = value * np.uint64(0xBF58476D1CE4E5B9)
+    value = value ^ (value >> np.uint64(27))
+    value = value * np.uint64(0x94D049BB133111EB)
+    return value ^ (value >> np.uint64(31))
 
-def birdHighJump(bird, windActive):
+def windRandom(streams, birdIds, tick, draw):
     """
-    Make the bird perform a high jump.
-    If wind is active, stop the downward displacement.
-    Otherwise, set a higher upward velocity.
+    Get one uniform number in [0, 1) per bird id for the given tick.
+    'draw' tells apart several numbers needed by the same bird in the same tick.
     """
-    bird['highJumpActive'] = True
-    if bird['windActive']:
-        # bird['velocity'] = 0  # Stop the downward displacement
-        bird['windActive'] = False
+    key = mixBits(np.array([streams['wind'] ^ (tick << 8) ^ draw], dtype=np.uint64))
+    value = mixBits(np.asarray(birdIds, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15) + key)
+    return (value >> np.uint64(11)) * (1.0 / 2 ** 53)
 
-    else:
-        bird['velocity'] -= 20  # Higher upward velocity
-    # bird['tickCount'] = 0
-    # bird['height'] = bird['y']
-
-def birdMove(bird):
-    """
-    Move the bird based on its velocity and gravity.
-    """
-    bird['tickCount'] += 1
-    displacement = bird['velocity'] * bird['tickCount'] + 1.5 * (bird['tickCount'] ** 2)
-    if displacement >= 16:
-        displacement = 16
-    if displacement < 0:
-        displacement -= 2
-    bird['y'] += displacement
-    if displacement < 0 or bird['y'] < bird['height'] + 50:
-        if bird['tilt'] < MAX_ROTATION:
-            bird['tilt'] = MAX_ROTATION
-    else:
-        if bird['tilt'] > -90:
-            bird['tilt'] -= ROTATION_VELOCITY
-
-            bird['windTimer'] += 1
-            
-def birdDraw(window, bird, isModeTraning=False):
+# Bird functions
+def birdDraw(window, bird):
     """
     Draw the bird on the window with the appropriate image and rotation.
+    The bird dicts come from populationBirds.
     """
-    if not isModeTraning:
-        if bird['highJumpActive']:
-            bird['image'] =  BIRD_OUTLINE_IMAGE
-    
-    if not bird['highJumpActive']:
-        # Regular animation logic
-        bird['imageCount'] = (bird['imageCount'] + 1) % (FRAME_DURATION_ANIMATION * len(BIRD_FLAPS))
-        bird['image'] = BIRD_FLAPS[bird['imageCount'] // FRAME_DURATION_ANIMATION]
-
     # Handle bird tilt
-    rotatedImage = pygame.transform.rotate(bird['image'], bird['tilt'])
-    newRect = rotatedImage.get_rect(center=bird['image'].get_rect(topleft=(bird['x'], bird['y'])).center)
+    image = loadAssets()['birds'][bird['imageIndex']]
+    rotatedImage = rotatedBirdImage(bird['imageIndex'], bird['tilt'])
+    newRect = rotatedImage.get_rect(center=image.get_rect(topleft=(bird['x'], bird['y'])).center)
     window.blit(rotatedImage, newRect.topleft)
 
-def birdGetCollisionMask(bird):
+# wall functions
+def drawWallHeight(rng):
     """
-    Get the collision mask for the bird's current image for collision detection.
+    Draw a random wall height from the random.Random 'rng'.
     """
-    return pygame.mask.from_surface(bird['image'])
+    return rng.randint(80, 200) if rng.random() < 0.5 else rng.randint(350, 550)
 
-# wall functions
-def createWall(x):
+def createWall(x, height):
     """
-    Create a wall with a random height.
+    Create a wall whose gap starts at 'height'.
     """
-    height = random.randint(80, 200) if random.random() < 0.5 else random.randint(350, 550)
     return {
         'x': x,
         'height': height,
-        'top': height - WALL_IMAGE.get_height(),
+        'top': height - WALL_HEIGHT,
         'bottom': height + 200,  # wall.GAP is 200
-        'WALL_TOP': pygame.transform.flip(WALL_IMAGE, False, True),
-        'WALL_BOTTOM': WALL_IMAGE,
         'passed': False
     }
 
+# Course functions
+# A course is the heights of an episode's walls, drawn ahead of time into a small int16 array.
+# The walls are 400 pixels apart and their top and bottom follow from the height, so the heights
+# are all an episode needs. Workers read one shared course instead of drawing their own.
+COURSE_LENGTH = 256
+
+def createCourse(seed, wallCount=COURSE_LENGTH):
+    """
+    Draw the heights of the first 'wallCount' walls of the episode with this seed.
+    They are the heights the episode's wall stream would give one by one, and a longer
+    course for the same seed starts with the same walls.
+    """
+    rng = createRandomStreams(seed)['walls']
+    return np.array([drawWallHeight(rng) for _ in range(wallCount)], dtype=np.int16)
+
+def shareCourse(course):
+    """
+    Copy a course into a new shared memory block that other processes can attach to by name.
+    The caller closes and unlinks the block once they are done.
+    """
+    sharedMemory = shared_memory.SharedMemory(create=True, size=course.nbytes)
+    np.ndarray(course.shape, dtype=course.dtype, buffer=sharedMemory.buf)[:] = course
+    return sharedMemory
+
+def attachCourse(name, wallCount):
+    """
+    Read a course shared by shareCourse into a local array.
+    """
+    sharedMemory = shared_memory.SharedMemory(name=name)
+    try:
+        # The creating process owns the block; keep this process's tracker from unlinking it
+        resource_tracker.unregister(sharedMemory._name, 'shared_memory')
+        return np.ndarray((wallCount,), dtype=np.int16, buffer=sharedMemory.buf).copy()
+    finally:
+        sharedMemory.close()
+
 def moveWall(wall):
     """
     Move the wall to the left.
@@ -157,21 +310,44 @@ def drawWall(window, wall):
     """
     Draw the wall on the window.
     """
-    window.blit(wall['WALL_TOP'], (wall['x'], wall['top']))
-    window.blit(wall['WALL_BOTTOM'], (wall['x'], wall['bottom']))
+    assets = loadAssets()
+    window.blit(displayImage(assets['wallTop']), (wall['x'], wall['top']))
+    window.blit(displayImage(assets['wall']), (wall['x'], wall['bottom']))
 
-def wallCollide(wall, bird):
+def wallCollideMask(wall, imageIndex, x, y):
+    """
+    Check if a bird showing the image 'imageIndex' at (x, y) overlaps the wall.
+    The masks are only compared when the bird's box overlaps the box of a wall part.
     """
-    Check if the bird collides with the wall.
+    y = round(y)
+    birdMask = BIRD_MASKS[imageIndex]
+    birdBounds = BIRD_BOUNDS[imageIndex]
+    if boxesOverlap(birdBounds, x, y, WALL_BOTTOM_BOUNDS, wall['x'], wall['bottom']) and masksOverlap(birdMask, x, y, WALL_BOTTOM_MASK, wall['x'], wall['bottom']):
+        return True
+    return bool(boxesOverlap(birdBounds, x, y, WALL_TOP_BOUNDS, wall['x'], wall['top']) and masksOverlap(birdMask, x, y, WALL_TOP_MASK, wall['x'], wall['top']))
+
+def masksOverlap(mask, x, y, otherMask, otherX, otherY):
     """
-    birdMask = birdGetCollisionMask(bird)
-    topMask = pygame.mask.from_surface(wall['WALL_TOP'])
-    bottomMask = pygame.mask.from_surface(wall['WALL_BOTTOM'])
-    topOffset = (wall['x'] - bird['x'], wall['top'] - round(bird['y']))
-    bottomOffset = (wall['x'] - bird['x'], wall['bottom'] - round(bird['y']))
-    bottomPoint = birdMask.overlap(bottomMask, bottomOffset)
-    topPoint = birdMask.overlap(topMask, topOffset)
-    return topPoint or bottomPoint
+    Check if 'mask' placed at (x, y) and 'otherMask' placed at (otherX, otherY) share a set pixel.
+    The positions are whole pixels.
+    """
+    offsetX = int(otherX - x)
+    offsetY = int(otherY - y)
+    top = max(0, offsetY)
+    bottom = min(mask.shape[0], offsetY + otherMask.shape[0])
+    left = max(0, offsetX)
+    right = min(mask.shape[1], offsetX + otherMask.shape[1])
+    if top >= bottom or left >= right:
+        return False
+    return bool((mask[top:bottom, left:right] & otherMask[top - offsetY:bottom - offsetY, left - offsetX:right - offsetX]).any())
+
+def boxesOverlap(bounds, x, y, otherBounds, otherX, otherY):
+    """
+    Check if the 'bounds' box placed at (x, y) overlaps the 'otherBounds' box placed at (otherX, otherY).
+    Works on scalars and on NumPy arrays of positions alike.
+    """
+    return ((x + bounds[0] < otherX + otherBounds[2]) & (otherX + otherBounds[0] < x + bounds[2]) &
+            (y + bounds[1] < otherY + otherBounds[3]) & (otherY + otherBounds[1] < y + bounds[3]))
 
 # Ground functions
 def createGround(y):
@@ -181,8 +357,7 @@ def createGround(y):
     return {
         'y': y,
         'x1': 0,
-        'x2': Ground_IMAGE.get_width(),
-        'image': Ground_IMAGE
+        'x2': GROUND_WIDTH
     }
 
 def moveGround(Ground):
@@ -191,71 +366,461 @@ def moveGround(Ground):
     """
     Ground['x1'] -= 5  # Ground.VELOCITY replaced with 5
     Ground['x2'] -= 5
-    if Ground['x1'] + Ground['image'].get_width() < 0:
-        Ground['x1'] = Ground['x2'] + Ground['image'].get_width()
-    if Ground['x2'] + Ground['image'].get_width() < 0:
-        Ground['x2'] = Ground['x1'] + Ground['image'].get_width()
+    if Ground['x1'] + GROUND_WIDTH < 0:
+        Ground['x1'] = Ground['x2'] + GROUND_WIDTH
+    if Ground['x2'] + GROUND_WIDTH < 0:
+        Ground['x2'] = Ground['x1'] + GROUND_WIDTH
 
 def drawGround(window, Ground):
     """
     Draw the Ground on the window.
     """
-    window.blit(Ground['image'], (Ground['x1'], Ground['y']))
-    window.blit(Ground['image'], (Ground['x2'], Ground['y']))
+    groundImage = displayImage(loadAssets()['ground'])
+    window.blit(groundImage, (Ground['x1'], Ground['y']))
+    window.blit(groundImage, (Ground['x2'], Ground['y']))
+
+# Population functions
+# A population keeps every bird of a generation as NumPy arrays, one entry per bird,
+# so physics, wind and bounds checks step all birds at once. These are the only
+# implementation of the game rules, every mode plays through them.
+def createPopulation(count, x, y, birdIds=None):
+    """
+    Create 'count' birds at (x, y). Dead birds stay in the arrays and are masked out by 'alive'.
+    'birdIds' pick each bird's wind in the wind stream; they default to 0 .. count - 1.
+    """
+    return {
+        'x': x,
+        'tick': 0,
+        'birdIds': np.arange(count) if birdIds is None else np.asarray(birdIds),
+        'y': np.full(count, y, dtype=float),
+        'tilt': np.zeros(count, dtype=int),
+        'tickCount': np.zeros(count, dtype=int),
+        'velocity': np.zeros(count, dtype=float),
+        'height': np.full(count, y, dtype=float),
+        'imageCount': np.zeros(count, dtype=int),
+        'imageIndex': np.zeros(count, dtype=int),
+        'windActive': np.zeros(count, dtype=bool),
+        'windTimer': np.zeros(count, dtype=int),
+        'highJumpActive': np.zeros(count, dtype=bool),
+        'alive': np.ones(count, dtype=bool)
+    }
 
-# Wind effect function
-def applyWindEffect(birds):
+def populationMove(population):
     """
-    Apply the wind effect to each bird individually.
+    Move every living bird based on its velocity and gravity.
     """
-    for bird in birds:
-        if not bird['windActive']:
-            if (not bird['highJumpActive']) and random.random() < 0.1:
-                bird['windActive'] = True
-                bird['windTimer'] = random.randint(12, 30)
-        if bird['windActive']:
-            bird['velocity'] += 20  # Modify wind displacement
-            bird['windTimer'] -= 1
-            if bird['windTimer'] <= 0:
-                bird['windActive'] = False
-                               
+    alive = population['alive']
+    population['tick'] += 1
+    tickCount = np.where(alive, population['tickCount'] + 1, population['tickCount'])
+    displacement = population['velocity'] * tickCount + 1.5 * (tickCount ** 2)
+    displacement = np.minimum(displacement, 16)
+    displacement = np.where(displacement < 0, displacement - 2, displacement)
+    y = np.where(alive, population['y'] + displacement, population['y'])
+    rising = alive & ((displacement < 0) | (y < population['height'] + 50))
+    falling = alive & ~rising & (population['tilt'] > -90)
+    population['tickCount'] = tickCount
+    population['y'] = y
+    population['tilt'] = np.where(rising & (population['tilt'] < MAX_ROTATION), MAX_ROTATION, population['tilt'])
+    population['tilt'] = np.where(falling, population['tilt'] - ROTATION_VELOCITY, population['tilt'])
+    population['windTimer'] = np.where(falling, population['windTimer'] + 1, population['windTimer'])
+
+def populationJump(population, jumping):
+    """
+    Make the birds selected by the 'jumping' mask jump.
+    """
+    population['velocity'][jumping] = -11
+    population['tickCount'][jumping] = 0
+    population['height'][jumping] = population['y'][jumping]
+
+def populationHighJump(population, highJumping):
+    """
+    Make the birds selected by the 'highJumping' mask perform a high jump.
+    Birds in the wind only escape it, the others get a higher upward velocity.
+    """
+    population['highJumpActive'][highJumping] = True
+    escaping = highJumping & population['windActive']
+    population['windActive'][escaping] = False
+    population['velocity'][highJumping & ~escaping] -= 20
+
+def populationApplyWind(population, streams):
+    """
+    Apply the wind effect to every living bird.
+    """
+    alive = population['alive']
+    birdIds = population['birdIds']
+    starting = alive & ~population['windActive'] & ~population['highJumpActive'] & (windRandom(streams, birdIds, population['tick'], 0) < 0.1)
+    population['windTimer'][starting] = 12 + (windRandom(streams, birdIds[starting], population['tick'], 1) * 19).astype(int)
+    population['windActive'] |= starting
+    blowing = alive & population['windActive']
+    population['velocity'][blowing] += 20
+    population['windTimer'][blowing] -= 1
+    population['windActive'][blowing & (population['windTimer'] <= 0)] = False
+
+def populationAnimate(population, isModeTraning=False):
+    """
+    Advance the flap animation of every living bird and pick the image index it shows.
+    """
+    flapping = population['alive'] & ~population['highJumpActive']
+    population['imageCount'] = np.where(flapping, (population['imageCount'] + 1) % (FRAME_DURATION_ANIMATION * BIRD_FLAP_COUNT), population['imageCount'])
+    population['imageIndex'] = population['imageCount'] // FRAME_DURATION_ANIMATION
+    if not isModeTraning:
+        population['imageIndex'] = np.where(population['highJumpActive'], BIRD_OUTLINE_INDEX, population['imageIndex'])
+
+def populationOutOfBounds(population, Ground):
+    """
+    Get a mask of the living birds that hit the Ground or flew off into the sky.
+    """
+    y = population['y']
+    return population['alive'] & ((y + BIRD_HEIGHT >= Ground['y']) | (y < 0))
+
+def populationWallCollide(population, wall):
+    """
+    Get a mask of the living birds that collide with the wall.
+    Birds away from the wall or clearly inside the gap are settled with box checks;
+    only the birds whose box overlaps a wall part are compared pixel by pixel.
+    """
+    collided = np.zeros(len(population['alive']), dtype=bool)
+    wallLeft = wall['x'] + min(WALL_TOP_BOUNDS[0], WALL_BOTTOM_BOUNDS[0])
+    wallRight = wall['x'] + max(WALL_TOP_BOUNDS[2], WALL_BOTTOM_BOUNDS[2])
+    if population['x'] + BIRD_BOUNDS[:, 2].max() <= wallLeft or population['x'] + BIRD_BOUNDS[:, 0].min() >= wallRight:
+        return collided
+    livingIndices = np.flatnonzero(population['alive'])
+    birdBounds = BIRD_BOUNDS[population['imageIndex'][livingIndices]].T
+    y = np.rint(population['y'][livingIndices])
+    nearWall = (boxesOverlap(birdBounds, population['x'], y, WALL_TOP_BOUNDS, wall['x'], wall['top']) |
+                boxesOverlap(birdBounds, population['x'], y, WALL_BOTTOM_BOUNDS, wall['x'], wall['bottom']))
+    for birdIndex in livingIndices[nearWall]:
+        collided[birdIndex] = wallCollideMask(wall, population['imageIndex'][birdIndex], population['x'], population['y'][birdIndex])
+    return collided
+
+def populationBirds(population):
+    """
+    Get a bird dict for each living bird, with just the fields drawWindow needs.
+    """
+    return [{
+        'x': population['x'],
+        'y': population['y'][birdIndex],
+        'tilt': population['tilt'][birdIndex],
+        'imageIndex': population['imageIndex'][birdIndex],
+        'windActive': population['windActive'][birdIndex],
+        'windTimer': population['windTimer'][birdIndex]
+    } for birdIndex in np.flatnonzero(population['alive'])]
+
+# Network functions
+# NumPy versions of neat's built-in activation functions, with the same input scaling and clamping.
+NUMPY_ACTIVATIONS = {getattr(neat.activations, name + "_activation"): policy.ACTIVATIONS[name] for name in policy.ACTIVATION_NAMES}
+
+def compileNetworks(networks):
+    """
+    Compile a list of neat FeedForwardNetworks into flat arrays so activateNetworks can
+    evaluate all of them in one vectorized pass.
+    Every node of every network gets a slot in one value vector, and the nodes are grouped
+    into layers by their depth from the inputs. Networks using an aggregation other than sum
+    or a custom activation are kept as they are and activated one by one.
+    """
+    slotCount = 0
+    inputSlots = []
+    outputSlots = []
+    layers = []
+    fallback = []
+
+    for networkIndex, network in enumerate(networks):
+        if any(aggregation is not neat.aggregations.sum_aggregation or activation not in NUMPY_ACTIVATIONS
+               for _, activation, aggregation, _, _, _ in network.node_evals):
+            fallback.append((networkIndex, network))
+            inputSlots.append([0] * len(network.input_nodes))
+            outputSlots.append([0] * len(network.output_nodes))
+            continue
+
+        # Output nodes that are never evaluated keep the value 0.0, like in FeedForwardNetwork
+        slots = {}
+        depths = {}
+        for node in network.input_nodes + network.output_nodes:
+            slots[node] = slotCount
+            depths[node] = 0
+            slotCount += 1
+
+        for node, activation, _, bias, response, links in network.node_evals:
+            depth = 1 + max((depths[source] for source, _ in links), default=0)
+            if depth > len(layers):
+                layers.append({'nodes': [], 'bias': [], 'response': [], 'activation': [], 'linkSource': [], 'linkTarget': [], 'linkWeight': []})
+            layer = layers[depth - 1]
+            if node not in slots:
+                slots[node] = slotCount
+                slotCount += 1
+            depths[node] = depth
+            for source, weight in links:
+                layer['linkSource'].append(slots[source])
+                layer['linkTarget'].append(len(layer['nodes']))
+                layer['linkWeight'].append(weight)
+            layer['nodes'].append(slots[node])
+            layer['bias'].append(bias)
+            layer['response'].append(response)
+            layer['activation'].append(activation)
+
+        inputSlots.append([slots[node] for node in network.input_nodes])
+        outputSlots.append([slots[node] for node in network.output_nodes])
+
+    for layer in layers:
+        activations = layer.pop('activation')
+        layer['activations'] = [(NUMPY_ACTIVATIONS[activation], np.array([i for i, a in enumerate(activations) if a is activation]))
+                                for activation in set(activations)]
+        for key in ('nodes', 'linkSource', 'linkTarget'):
+            layer[key] = np.array(layer[key], dtype=int)
+        for key in ('bias', 'response', 'linkWeight'):
+            layer[key] = np.array(layer[key], dtype=float)
+
+    return {
+        'size': slotCount,
+        'inputSlots': np.array(inputSlots, dtype=int),
+        'outputSlots': np.array(outputSlots, dtype=int),
+        'layers': layers,
+        'fallback': fallback
+    }
+
+def activateNetworks(compiled, inputs):
+    """
+    Activate every compiled network at once. Row i of 'inputs' goes to network i,
+    and row i of the result holds that network's outputs.
+    """
+    values = np.zeros(compiled['size'])
+    values[compiled['inputSlots']] = inputs
+    for layer in compiled['layers']:
+        sums = np.bincount(layer['linkTarget'], weights=values[layer['linkSource']] * layer['linkWeight'], minlength=len(layer['nodes']))
+        total = layer['bias'] + layer['response'] * sums
+        if len(layer['activations']) == 1:
+            total = layer['activations'][0][0](total)
+        else:
+            for activation, nodeIndices in layer['activations']:
+                total[nodeIndices] = activation(total[nodeIndices])
+        values[layer['nodes']] = total
+    outputs = values[compiled['outputSlots']]
+    for networkIndex, network in compiled['fallback']:
+        outputs[networkIndex] = network.activate(inputs[networkIndex])
+    return outputs
+
+def genomeSignature(genome):
+    """
+    Describe everything about a genome that its network depends on: the nodes with their
+    bias, response, activation and aggregation, and the enabled connections with their weights.
+    Genomes with the same signature build the same network, whatever their key.
+    """
+    nodes = tuple(sorted((key, node.bias, node.response, node.activation, node.aggregation) for key, node in genome.nodes.items()))
+    connections = tuple(sorted((key, connection.weight) for key, connection in genome.connections.items() if connection.enabled))
+    return nodes, connections
+
+# Number of networks NetworkCache keeps, a few generations of the default population
+NETWORK_CACHE_SIZE = 1000
+
+class NetworkCache:
+    """
+    Least recently used cache of FeedForwardNetworks keyed by genomeSignature, so elites and
+    other genomes carried over unchanged skip the topological sort of FeedForwardNetwork.create.
+    A network can be shared like this because activating it only depends on its inputs.
+    """
+    def __init__(self, size=NETWORK_CACHE_SIZE):
+        self.size = size
+        self.networks = OrderedDict()
+
+    def create(self, genome, config):
+        """
+        Get the network of 'genome', building it only if no genome with the same signature was seen recently.
+        """
+        signature = genomeSignature(genome)
+        network = self.networks.get(signature)
+        if network is not None:
+            self.networks.move_to_end(signature)
+            return network
+        network = neat.nn.FeedForwardNetwork.create(genome, config)
+        self.networks[signature] = network
+        if len(self.networks) > self.size:
+            self.networks.popitem(last=False)
+        return network
+
+# The networks of recent generations, one cache per process
+NETWORK_CACHE = NetworkCache()
+
+# Version of the game rules. Bump it whenever a change to the game changes the fitness a genome
+# gets on a course, so FitnessCache never mixes up fitness from before and after the change.
+ENV_VERSION = 1
+
+class FitnessCache:
+    """
+    Least recently used cache of the fitness genomes got in single episodes, keeping up to 'size'
+    of them. The key is the genome's genomeSignature and key (which picks its wind), the episode
+    seed, the settings that shape an episode and ENV_VERSION. A genome carried over unchanged,
+    like an elite, gets the same fitness on the same course again, so with 'course_seed' it only
+    plays each course once.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.scores = OrderedDict()
+
+    def lookup(self, genomeList, seeds, settings):
+        """
+        Get the cached fitness of every genome in 'genomeList' (rows) in the episode of every seed
+        (columns), NaN where the genome has to play the episode, and the keys to store it under.
+        """
+        rules = (ENV_VERSION, settings['max_ticks'], settings['max_score'], settings['decision_interval'], settings['decision_events'])
+        keys = []
+        for genome in genomeList:
+            signature = genomeSignature(genome)
+            keys.append([(signature, genome.key, seed, rules) for seed in seeds])
+        scores = np.full((len(genomeList), len(seeds)), np.nan)
+        for genomeIndex, genomeKeys in enumerate(keys):
+            for episodeIndex, key in enumerate(genomeKeys):
+                score = self.scores.get(key)
+                if score is None:
+                    continue
+                self.scores.move_to_end(key)
+                scores[genomeIndex, episodeIndex] = score
+        return scores, keys
+
+    def store(self, keys, scores, genomeIndices, episodeIndex, episode):
+        """
+        Remember the fitness the genomes at 'genomeIndices' got in the episode 'episodeIndex' of 'scores'.
+        Episodes cut short by 'quit' or the fitness threshold are left out, since other genomes decided when they ended.
+        """
+        if episode['stopReason'] in ('quit', 'fitnessThreshold'):
+            return
+        for genomeIndex in genomeIndices:
+            key = keys[genomeIndex][episodeIndex]
+            self.scores[key] = float(scores[genomeIndex, episodeIndex])
+            self.scores.move_to_end(key)
+        while len(self.scores) > self.size:
+            self.scores.popitem(last=False)
+
+def cachedScores(genomeList, seeds, settings, fitnessCache=None, episodes=None):
+    """
+    Start the scores of a generation: the fitness of every genome (rows) in every episode (columns)
+    that the optional FitnessCache 'fitnessCache' has, and NaN where the genome has to play.
+    Also returns the keys to store the new scores under, and tells the EpisodeReporter 'episodes'
+    how many scores were cached.
+    """
+    if fitnessCache is None:
+        return np.full((len(genomeList), len(seeds)), np.nan), None
+    scores, keys = fitnessCache.lookup(genomeList, seeds, settings)
+    if episodes:
+        episodes.addCachedScores(int(np.count_nonzero(~np.isnan(scores))), scores.size)
+    return scores, keys
+
+# Speciation
+def speciesSetType(name):
+    """
+    The species set class for the 'species_set' setting: neat.DefaultSpeciesSet for 'default'
+    or speciation.VectorizedSpeciesSet for 'vectorized'.
+    """
+    if name == 'default':
+        return neat.DefaultSpeciesSet
+    if name == 'vectorized':
+        return speciation.VectorizedSpeciesSet
+    raise ValueError(f"Unknown species set {name!r}, use 'default' or 'vectorized'")
+
+def loadConfig(configPath, speciesSet='default'):
+    """
+    Load the NEAT configuration with the species set named by 'speciesSet', see speciesSetType.
+    Both species sets take their parameters from the [DefaultSpeciesSet] section, so a standard
+    NEAT config file works with either of them.
+    """
+    config = neat.config.Config(
+        neat.DefaultGenome,
+        neat.DefaultReproduction,
+        neat.DefaultSpeciesSet,
+        neat.DefaultStagnation,
+        configPath
+    )
+    config.species_set_type = speciesSetType(speciesSet)
+    return config
+
+# Render cache
+# Bird tilts step down by ROTATION_VELOCITY from 0 or MAX_ROTATION until they pass -90,
+# so a bird only ever shows a few dozen rotated images.
+BIRD_TILTS = sorted({tilt for start in (0, MAX_ROTATION) for tilt in range(start, -90 - ROTATION_VELOCITY, -ROTATION_VELOCITY)})
+
+# Surfaces ready to blit: images converted to the window's pixel format, rotated bird images
+# keyed by (image index, tilt), the wind frames at their drawing angle and the HUD text of each slot.
+RENDER_CACHE = {'images': {}, 'birds': {}, 'wind': [], 'text': {}}
+
+def displayImage(image):
+    """
+    Get a copy of 'image' converted to the window's pixel format, which blits much faster.
+    """
+    converted = RENDER_CACHE['images'].get(image)
+    if converted is None:
+        converted = RENDER_CACHE['images'][image] = image.convert_alpha()
+    return converted
+
+def rotatedBirdImage(imageIndex, tilt):
+    """
+    Get the bird image 'imageIndex' rotated by 'tilt', rotating it only the first time.
+    """
+    rotated = RENDER_CACHE['birds'].get((imageIndex, tilt))
+    if rotated is None:
+        image = loadAssets()['birds'][imageIndex]
+        rotated = RENDER_CACHE['birds'][(imageIndex, tilt)] = pygame.transform.rotate(image, tilt).convert_alpha()
+    return rotated
+
+def buildRenderCache():
+    """
+    Rotate every bird image to every tilt and the wind frames to their drawing angle up front.
+    Needs the window, since the surfaces are converted to its pixel format.
+    """
+    if RENDER_CACHE['wind']:
+        return
+    assets = loadAssets()
+    for imageIndex in range(len(assets['birds'])):
+        for tilt in BIRD_TILTS:
+            rotatedBirdImage(imageIndex, tilt)
+    RENDER_CACHE['wind'] = [pygame.transform.rotate(image, 90).convert_alpha() for image in assets['wind']]
+
+def hudText(slot, font, text, color, halfSize=False):
+    """
+    Render a line of HUD text for 'slot', reusing the last surface of that slot while its text does not change.
+    With 'halfSize' the text is scaled down to half its size.
+    """
+    cached = RENDER_CACHE['text'].get(slot)
+    if cached and cached[0] == (font, text, color):
+        return cached[1]
+    surface = font.render(text, 1, color)
+    if halfSize:
+        surface = pygame.transform.scale(surface, (surface.get_width() // 2, surface.get_height() // 2))
+    RENDER_CACHE['text'][slot] = ((font, text, color), surface)
+    return surface
+
 # Drawing function
 def drawWindow(window, walls, birds, Ground, score, font, windActiveGenomes=None, highJumpActiveGenomes=None, windIncomingGenomes=None, generation=None, isModeTraning=False):
     """
     Draw all game elements on the window.
     """
-    window.blit(BACKGROUND_IMAGE, (0, 0))
+    window.blit(displayImage(loadAssets()['background']), (0, 0))
     for wall in walls:
         drawWall(window, wall)
     drawGround(window, Ground)
     for bird in birds:
-        birdDraw(window, bird, isModeTraning)
+        birdDraw(window, bird)
         if bird['windActive'] and not isModeTraning: 
-            wind_image_index = (bird['windTimer'] // 6) % len(WIND_IMAGES)  # Change image every 5 ticks
-            wind_image = WIND_IMAGES[wind_image_index]
-            window.blit(pygame.transform.rotate(wind_image, 90), (bird['x'] - 250, bird['y'] - bird['image'].get_height() - 330))
+            wind_image_index = (bird['windTimer'] // 6) % len(RENDER_CACHE['wind'])  # Change image every 5 ticks
+            wind_image = RENDER_CACHE['wind'][wind_image_index]
+            window.blit(wind_image, (bird['x'] - 250, bird['y'] - BIRD_HEIGHT - 330))
             
-    scoreText = font.render(f"Score: {score}", 1, (255, 255, 255))
+    scoreText = hudText('score', font, f"Score: {score}", (255, 255, 255))
     window.blit(scoreText, (WINDOW_WIDTH - scoreText.get_width() - 10, 10))
     
 
     if generation is not None:
-        generationText = font.render(f"Gen: {generation}", 1, (255, 255, 255))
+        generationText = hudText('generation', font, f"Gen: {generation}", (255, 255, 255))
         window.blit(generationText, (10, 10))
 
     if windActiveGenomes:
-        windText = font.render(f"Wind Active for genomes: {', '.join(map(str, windActiveGenomes))}", 1, (255, 0, 0))
-        windText = pygame.transform.scale(windText, (windText.get_width() // 2, windText.get_height() // 2))
+        windText = hudText('windActive', font, f"Wind Active for genomes: {', '.join(map(str, windActiveGenomes))}", (255, 0, 0), halfSize=True)
         windTextRect = windText.get_rect(center=(WINDOW_WIDTH // 3, 100))
         window.blit(windText, windTextRect)
     if windIncomingGenomes:
-        windIncomingText = font.render(f"Wind Incoming for genomes: {', '.join(map(str, windIncomingGenomes))}", 1, (0, 255, 0))
-        windIncomingText = pygame.transform.scale(windIncomingText, (windIncomingText.get_width() // 2, windIncomingText.get_height() // 2))
+        windIncomingText = hudText('windIncoming', font, f"Wind Incoming for genomes: {', '.join(map(str, windIncomingGenomes))}", (0, 255, 0), halfSize=True)
         windIncomingTextRect = windIncomingText.get_rect(center=(WINDOW_WIDTH // 3, 150))
         window.blit(windIncomingText, windIncomingTextRect)
     if highJumpActiveGenomes:
-        highJumpText = font.render(f"High Jump Active for genomes: {', '.join(map(str, highJumpActiveGenomes))}", 1, (0, 0, 255))
-        highJumpText = pygame.transform.scale(highJumpText, (highJumpText.get_width() // 2, highJumpText.get_height() // 2))
+        highJumpText = hudText('highJumpActive', font, f"High Jump Active for genomes: {', '.join(map(str, highJumpActiveGenomes))}", (0, 0, 255), halfSize=True)
         highJumpTextRect = highJumpText.get_rect(center=(WINDOW_WIDTH // 3, 200))
         window.blit(highJumpText, highJumpTextRect)
         
@@ -263,148 +828,945 @@ def drawWindow(window, walls, birds, Ground, score, font, windActiveGenomes=None
     pygame.display.update()
     
 # Main function
-def main(genomes, config):
+def main(genomes, config, headless=False, profiler=None, settings=None, episodes=None, fitnessCache=None):
     """
     Main function to run the NEAT algorithm and the game.
+    When 'headless' is True no window is created, nothing is drawn and the frame cap is skipped,
+    so the generation runs as fast as the CPU allows with the same fitness as the rendered mode.
+    'profiler' is an optional ProfileReporter that times the phases of the generation.
+    'settings' holds the episode limits and drawing rate from loadSettings, and the optional EpisodeReporter
+    'episodes' gets told how the episodes ended.
+    With 'episodes_per_genome' above 1 every genome plays that many episodes, all genomes meeting
+    the same seeds, and its fitness is their 'fitness_aggregation': the mean, the minimum or the
+    'fitness_quantile' quantile.
+    Genomes whose fitness in an episode the optional FitnessCache 'fitnessCache' has skip that episode.
     """
+    settings = settings or DEFAULT_SETTINGS
     global generation 
     generation += 1
 
-    pygame.init()
-    window = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-
-    birds = []
+    if profiler:
+        start = time.perf_counter()
     networks = []
     genomeList = []
 
     for _, genome in genomes:
-        net = neat.nn.FeedForwardNetwork.create(genome, config)
+        net = NETWORK_CACHE.create(genome, config)
         networks.append(net)
-        birds.append(createBird(230, 350))
         genome.fitness = 0
         genomeList.append(genome)
 
-    Ground = createGround(730)
-    walls = [createWall(400)]
-    clock = pygame.time.Clock()
-    score = 0
-    font = pygame.font.SysFont("comicsans", 50)
+    if profiler:
+        profiler.lap('setup', start)
 
-    run = True
+    # Genome keys pick the birds' wind, so a genome meets the same wind whichever process plays it
+    seeds = episodeSeeds(settings)
+    scores, cacheKeys = cachedScores(genomeList, seeds, settings, fitnessCache, episodes)
     stop_training = False
-    
-    while run:
-        clock.tick(30)
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                quit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_q:  # Press 'Q' to quit after the current generation
-                    stop_training = True
-                    run = False
-                    break
-
+    for episodeIndex, seed in enumerate(seeds):
+        playing = np.flatnonzero(np.isnan(scores[:, episodeIndex]))
+        if not len(playing):
+            continue
+        scores[playing, episodeIndex], episode = playPopulation([networks[genomeIndex] for genomeIndex in playing], headless=headless, seed=seed,
+                                                                birdIds=[genomeList[genomeIndex].key for genomeIndex in playing], profiler=profiler,
+                                                                maxTicks=settings['max_ticks'], maxScore=settings['max_score'], fitnessThreshold=episodeFitnessThreshold(config, settings),
+                                                                renderEvery=settings['render_every'], displayFps=settings['display_fps'],
+                                                                decisionInterval=settings['decision_interval'], decisionEvents=settings['decision_events'])
+        if episodes:
+            episodes.addEpisode(episode)
+        if fitnessCache:
+            fitnessCache.store(cacheKeys, scores, playing, episodeIndex, episode)
+        stop_training = episode['stopReason'] == 'quit'
         if stop_training:
+            scores = scores[:, :episodeIndex + 1]
             break
 
-        wall_Index = 0
-        if len(birds) > 0:
-            if len(walls) > 1 and birds[0]['x'] > walls[0]['x'] + walls[0]['WALL_TOP'].get_width():
-                wall_Index = 1
-        else:
-            run = False
-            break
-
-        for birdIndex, bird in enumerate(birds):
-            birdMove(bird)
-            genomeList[birdIndex].fitness += 0.6  # Reward for staying alive
-
-            windIncoming = 1 if bird['windTimer'] > 12 else 0  # Wind incoming in approximately 0.4 seconds
-            inputs = (bird['y'], abs(bird['y'] - walls[wall_Index]['height']), abs(bird['y'] - walls[wall_Index]['bottom']), walls[wall_Index]['height'], windIncoming, int(bird['windActive']))
-            output = networks[birdIndex].activate(inputs)
-
-            highJumpOutput = output[1]
-            jumpOutput = output[0]
+    assignFitness(genomeList, scores, settings, episodes)
 
-            if highJumpOutput > 0.5:
-                birdHighJump(bird, bird['windActive'])
-                genomeList[birdIndex].fitness += 0.2
+    # Save the best genome to a file
+    if stop_training:
+        winner = max(genomes, key=lambda g: g[1].fitness)
+        if winner[1].fitness >= config.fitness_threshold:
+            saveWinner(winner[1], config, settings)
 
-                if bird['x'] > walls[wall_Index]['x'] and bird['x'] < walls[wall_Index]['x'] + walls[wall_Index]['WALL_TOP'].get_width():
-                    if bird['y'] > walls[wall_Index]['top'] and bird['y'] < walls[wall_Index]['bottom']:
-                        genomeList[birdIndex].fitness -= 0  # Punishment for using high jump inside the walls
-            else:
-                bird['highJumpActive'] = False
+def episodeSeeds(settings):
+    """
+    Draw the seeds of the 'episodes_per_genome' episodes of a generation from 'random', or with a
+    'course_seed' derive the same ones for every generation from it.
+    """
+    if settings['course_seed']:
+        courses = random.Random(settings['course_seed'])
+        return [courses.randrange(2 ** 32) for _ in range(settings['episodes_per_genome'])]
+    return [random.randrange(2 ** 32) for _ in range(settings['episodes_per_genome'])]
 
+def episodeFitnessThreshold(config, settings):
+    """
+    Get the fitness at which a bird ends its episode early, because NEAT stops training after this
+    generation: the config's fitness_threshold when NEAT stops on the best fitness and every genome
+    plays a single episode, so its fitness is that episode's. None otherwise, where one lucky
+    episode does not end the training.
+    """
+    if config.no_fitness_termination or config.fitness_criterion != 'max' or settings['episodes_per_genome'] != 1:
+        return None
+    return config.fitness_threshold
 
-            if jumpOutput > 0.5:
-                birdJump(bird)
+def aggregateFitness(scores, aggregation='mean', quantile=0.25):
+    """
+    Combine the fitness of each genome (a row of 'scores') over its episodes (the columns) into one value:
+    the 'mean', the 'min' or the 'quantile' given by 'quantile'.
+    """
+    if aggregation == 'mean':
+        return scores.mean(axis=1)
+    if aggregation == 'min':
+        return scores.min(axis=1)
+    if aggregation == 'quantile':
+        return np.quantile(scores, quantile, axis=1)
+    raise ValueError(f"Unknown fitness aggregation {aggregation!r}, use 'mean', 'min' or 'quantile'")
+
+def assignFitness(genomeList, scores, settings, episodes=None):
+    """
+    Set the fitness of every genome in 'genomeList' to its row of 'scores' combined as 'settings' ask,
+    and its 'fitnessStd' to the standard deviation of that row, and hand the scores to the optional
+    EpisodeReporter 'episodes'.
+    """
+    if episodes:
+        episodes.addScores(scores, [genome.key for genome in genomeList])
+    aggregated = aggregateFitness(scores, settings['fitness_aggregation'], settings['fitness_quantile'])
+    for genome, genomeFitness, genomeStd in zip(genomeList, aggregated, scores.std(axis=1)):
+        genome.fitness = float(genomeFitness)
+        genome.fitnessStd = float(genomeStd)
+
+# Profiling
+class ProfileReporter(neat.reporting.BaseReporter):
+    """
+    Reporter that times the phases of each training generation and prints where the time went,
+    next to StdOutReporter and StatisticsReporter. With 'csvPath' every generation is also
+    appended to that CSV file. The game only pays for the timing when a profiler is passed in,
+    and it only sees generations evaluated in this process.
+    """
+    PHASES = ['setup', 'events', 'birdMove', 'observations', 'activation', 'actions', 'wallCollide', 'listRebuilds', 'applyWindEffect', 'birdAnimate', 'stateIndices', 'drawWindow', 'frameCap']
+
+    def __init__(self, csvPath=None):
+        self.csvPath = csvPath
+        self.generation = None
+        self.startTime = None
+        self.ticks = 0
+        self.times = dict.fromkeys(self.PHASES, 0.0)
+
+    def lap(self, phase, start):
+        """
+        Add the time since 'start' to 'phase' and return the current time for the next phase.
+        """
+        now = time.perf_counter()
+        self.times[phase] += now - start
+        return now
+
+    def start_generation(self, generation):
+        self.generation = generation
+        self.ticks = 0
+        self.times = dict.fromkeys(self.PHASES, 0.0)
+        self.startTime = time.perf_counter()
+
+    def post_evaluate(self, config, population, species, best_genome):
+        total = time.perf_counter() - self.startTime
+        other = max(total - sum(self.times.values()), 0.0)
+        print(f"Profile of generation {self.generation}: {total:.3f} sec over {self.ticks} ticks")
+        for phase, seconds in list(self.times.items()) + [('other', other)]:
+            share = 100 * seconds / total if total else 0.0
+            print(f"    {phase:<16}{seconds:9.4f} sec {share:6.1f}%")
+
+        if self.csvPath:
+            newFile = not os.path.exists(self.csvPath)
+            with open(self.csvPath, 'a', newline='') as output:
+                writer = csv.writer(output)
+                if newFile:
+                    writer.writerow(['generation', 'ticks', 'total'] + self.PHASES + ['other'])
+                writer.writerow([self.generation, self.ticks, total] + [self.times[phase] for phase in self.PHASES] + [other])
+
+# Episode statistics
+class EpisodeReporter(neat.reporting.BaseReporter):
+    """
+    Reporter that prints how long the episodes of each generation ran and why they ended:
+    every bird died, 'maxTicks', 'maxScore', 'fitnessThreshold' or 'quit', how often the
+    networks were asked for actions when that was not every tick and how many episode scores
+    came from the FitnessCache. When genomes play
+    several episodes it also prints how much their fitness varies from one episode to the next,
+    and keeps the standard deviation of every genome of the current generation by key in 'fitnessStd'.
+    The summaries of the last 'historyLength' generations are kept in 'history', so capped
+    generations can be told apart afterwards.
+    """
+    def __init__(self, historyLength=1000):
+        self.generation = None
+        self.episodes = []
+        self.scores = None
+        self.genomeKeys = None
+        self.fitnessStd = {}
+        self.cachedScores = 0
+        self.cacheLookups = 0
+        self.history = deque(maxlen=historyLength)
+
+    def addEpisode(self, episode):
+        """
+        Record one finished episode of the current generation.
+        """
+        self.episodes.append(episode)
+
+    def addScores(self, scores, genomeKeys=None):
+        """
+        Record the fitness of every genome (rows) in every episode (columns) of the current generation,
+        with the keys of the genomes in row order.
+        """
+        self.scores = scores
+        self.genomeKeys = genomeKeys
+
+    def addCachedScores(self, cached, lookups):
+        """
+        Record that 'cached' of the 'lookups' episode scores looked up in the FitnessCache were found.
+        """
+        self.cachedScores += cached
+        self.cacheLookups += lookups
+
+    def start_generation(self, generation):
+        self.generation = generation
+        self.episodes = []
+        self.scores = None
+        self.genomeKeys = None
+        self.fitnessStd = {}
+        self.cachedScores = 0
+        self.cacheLookups = 0
+
+    def post_evaluate(self, config, population, species, best_genome):
+        if not self.episodes:
+            return
+        stopReasons = {}
+        for episode in self.episodes:
+            if episode['stopReason']:
+                stopReasons[episode['stopReason']] = stopReasons.get(episode['stopReason'], 0) + 1
+        summary = {
+            'generation': self.generation,
+            'episodes': len(self.episodes),
+            'ticks': sum(episode['ticks'] for episode in self.episodes),
+            'maxTicks': max(episode['ticks'] for episode in self.episodes),
+            'maxScore': max(episode['score'] for episode in self.episodes),
+            'stopReasons': stopReasons,
+            'decisions': sum(episode['decisions'] for episode in self.episodes),
+            'eventDecisions': sum(episode['eventDecisions'] for episode in self.episodes),
+            'cachedScores': self.cachedScores,
+            'cacheLookups': self.cacheLookups
+        }
+        if self.scores is not None and self.scores.shape[1] > 1:
+            spread = self.scores.std(axis=1)
+            fittest = max(range(len(self.scores)), key=lambda genomeIndex: self.scores[genomeIndex].mean())
+            summary['episodesPerGenome'] = self.scores.shape[1]
+            summary['meanFitnessStd'] = float(spread.mean())
+            summary['fittestScores'] = self.scores[fittest].tolist()
+            if self.genomeKeys is not None:
+                self.fitnessStd = dict(zip(self.genomeKeys, spread.tolist()))
+        self.history.append(summary)
+        capped = ", ".join(f"{count} by {reason}" for reason, count in stopReasons.items()) or "none"
+        print(f"Episodes: {summary['episodes']}, longest {summary['maxTicks']} ticks, best score {summary['maxScore']}, stopped early: {capped}")
+        if summary['decisions'] < summary['ticks']:
+            print(f"Networks asked on {summary['decisions']} of {summary['ticks']} ticks ({summary['decisions'] / summary['ticks']:.0%}), "
+                  f"and {summary['eventDecisions']} times for a single bird whose wind started")
+        if self.cacheLookups:
+            print(f"Fitness cache: {self.cachedScores} of {self.cacheLookups} episode scores reused ({self.cachedScores / self.cacheLookups:.0%})")
+        if 'episodesPerGenome' in summary:
+            fittestScores = self.scores[fittest]
+            print(f"Fitness over {summary['episodesPerGenome']} episodes: mean standard deviation {summary['meanFitnessStd']:.2f}, "
+                  f"genome with the best mean: min {fittestScores.min():.2f}, mean {fittestScores.mean():.2f}, max {fittestScores.max():.2f}")
+
+# Telemetry
+class TelemetryReporter(neat.reporting.BaseReporter):
+    """
+    Reporter that appends one JSON line of metrics per generation to 'path': the best, mean,
+    minimum and standard deviation of the fitness, the episode-to-episode standard deviation of
+    the best genome and the largest one in the population, the number of species, the genome sizes and
+    the ticks simulated and their rate, taken from the EpisodeReporter 'episodes'. Nothing is
+    kept in memory. Once the file grows past 'maxBytes' it is renamed to path.1, the older ones
+    move up to path.2 and so on, and only 'backups' of them are kept.
+    Plot it with 'python main.py --mode plot'.
+    """
+    def __init__(self, path, episodes, maxBytes=10000000, backups=5):
+        self.path = path
+        self.episodes = episodes
+        self.maxBytes = maxBytes
+        self.backups = backups
+        self.generation = None
+        self.start = None
+
+    def start_generation(self, generation):
+        self.generation = generation
+        self.start = time.perf_counter()
+
+    def post_evaluate(self, config, population, species, best_genome):
+        seconds = time.perf_counter() - self.start
+        fitness = np.array([genome.fitness for genome in population.values()])
+        sizes = np.array([genome.size() for genome in population.values()])
+        ticks = sum(episode['ticks'] for episode in self.episodes.episodes)
+        record = {
+            'generation': self.generation,
+            'time': time.time(),
+            'seconds': seconds,
+            'bestFitness': float(fitness.max()),
+            'meanFitness': float(fitness.mean()),
+            'minFitness': float(fitness.min()),
+            'stdFitness': float(fitness.std()),
+            'bestFitnessStd': getattr(best_genome, 'fitnessStd', None),
+            'maxFitnessStd': max((getattr(genome, 'fitnessStd', 0.0) for genome in population.values()), default=0.0),
+            'species': len(species.species),
+            'meanNodes': float(sizes[:, 0].mean()),
+            'meanConnections': float(sizes[:, 1].mean()),
+            'bestGenomeSize': list(best_genome.size()),
+            'episodes': len(self.episodes.episodes),
+            'ticks': ticks,
+            'decisions': sum(episode['decisions'] for episode in self.episodes.episodes),
+            'cacheHitRate': self.episodes.cachedScores / self.episodes.cacheLookups if self.episodes.cacheLookups else None,
+            'ticksPerSecond': ticks / seconds if seconds else 0.0,
+            'bestScore': max((episode['score'] for episode in self.episodes.episodes), default=0)
+        }
+        self.rotate()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a") as telemetryFile:
+            telemetryFile.write(json.dumps(record) + "\n")
+
+    def rotate(self):
+        """
+        Move the file aside once it is too big, dropping the oldest backup.
+        """
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < self.maxBytes:
+            return
+        for backup in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{backup}"):
+                os.replace(f"{self.path}.{backup}", f"{self.path}.{backup + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
 
-        moveGround(Ground)
+def readTelemetry(path):
+    """
+    Read the records of a telemetry file and its backups, oldest first.
+    When a run was resumed from a checkpoint, the last record of each generation wins.
+    """
+    backups = []
+    backup = 1
+    while os.path.exists(f"{path}.{backup}"):
+        backups.append(f"{path}.{backup}")
+        backup += 1
+    records = {}
+    for telemetryPath in backups[::-1] + ([path] if os.path.exists(path) else []):
+        with open(telemetryPath) as telemetryFile:
+            for line in telemetryFile:
+                if line.strip():
+                    record = json.loads(line)
+                    records[record['generation']] = record
+    return [records[generation] for generation in sorted(records)]
+
+# Checkpoints
+class AsyncCheckpointer(neat.reporting.BaseReporter):
+    """
+    Reporter that saves the whole training state every 'interval' generations: the population,
+    species, generation counter, random state and the history of the reporters in 'reporters'.
+    The state is pickled in memory at the end of the generation, because the next generation
+    changes it, and then compressed and written to 'directory' on a background thread while
+    training goes on. Only the newest 'keep' checkpoints are kept.
+    """
+    def __init__(self, population, reporters, interval=10, directory=CHECKPOINT_DIR, keep=3):
+        self.population = population
+        self.reporters = reporters
+        self.interval = interval
+        self.directory = directory
+        self.keep = keep
+        self.generation = None
+        self.lastSaved = population.generation - 1
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.writeCheckpoints, daemon=True)
+        self.thread.start()
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def end_generation(self, config, population, species_set):
+        if self.generation - self.lastSaved < self.interval:
+            return
+        self.lastSaved = self.generation
+
+        # A fresh counter that starts at the same key, so new genomes get the keys they would without the checkpoint
+        reproduction = self.population.reproduction
+        nextGenomeKey = next(reproduction.genome_indexer)
+        reproduction.genome_indexer = itertools.count(nextGenomeKey)
+
+        # The species set points to the reporters, this one included, which are not saved with it
+        speciesReporters = species_set.reporters
+        species_set.reporters = None
+        try:
+            data = pickle.dumps({
+                'generation': self.generation + 1,
+                'config': config,
+                'population': population,
+                'speciesSet': species_set,
+                'bestGenome': self.population.best_genome,
+                'nextGenomeKey': nextGenomeKey,
+                'ancestors': reproduction.ancestors,
+                'randomState': random.getstate(),
+                'gameGeneration': generation,
+                'reporters': self.reporters
+            }, pickle.HIGHEST_PROTOCOL)
+        finally:
+            species_set.reporters = speciesReporters
+
+        path = os.path.join(self.directory, f"neat-checkpoint-{self.generation + 1}.gz")
+        self.queue.put((path, data))
+
+    def writeCheckpoints(self):
+        """
+        Compress and write the queued checkpoints until close() is called. Runs on the background thread.
+        """
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            path, data = job
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                # Write next to the checkpoint first, so a crash never leaves half a checkpoint behind
+                with gzip.open(path + ".tmp", "wb", compresslevel=5) as output:
+                    output.write(data)
+                os.replace(path + ".tmp", path)
+                for oldPath in listCheckpoints(self.directory)[:-self.keep]:
+                    os.remove(oldPath)
+            except OSError as error:
+                print(f"Saving checkpoint {path} failed: {error}")
+
+    def close(self):
+        """
+        Wait for the checkpoints still being written and stop the background thread.
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+def listCheckpoints(directory=CHECKPOINT_DIR):
+    """
+    Get the paths of the checkpoints in 'directory', oldest generation first.
+    """
+    if not os.path.isdir(directory):
+        return []
+    checkpoints = []
+    for name in os.listdir(directory):
+        if name.startswith("neat-checkpoint-") and name.endswith(".gz"):
+            checkpoints.append((int(name[len("neat-checkpoint-"):-len(".gz")]), os.path.join(directory, name)))
+    return [path for _, path in sorted(checkpoints)]
+
+def restoreCheckpoint(path):
+    """
+    Load a checkpoint written by AsyncCheckpointer and rebuild the neat.Population from it.
+    The random state and the generation counter of the game are restored as well.
+    Returns the population and the saved reporters.
+    """
+    global generation
+    with gzip.open(path, "rb") as checkpointFile:
+        checkpoint = pickle.load(checkpointFile)
+
+    population = neat.Population(checkpoint['config'], (checkpoint['population'], checkpoint['speciesSet'], checkpoint['generation']))
+    population.species.reporters = population.reporters
+    population.best_genome = checkpoint['bestGenome']
+    population.reproduction.genome_indexer = itertools.count(checkpoint['nextGenomeKey'])
+    population.reproduction.ancestors = checkpoint['ancestors']
+    random.setstate(checkpoint['randomState'])
+    generation = checkpoint['gameGeneration']
+    return population, checkpoint['reporters']
+
+# Replays
+class ReplayReporter(neat.reporting.BaseReporter):
+    """
+    Reporter that saves a replay of the 'topCount' fittest genomes of every generation to 'directory',
+    keeping the newest 'keep' of them. They play their generation's first episode again by
+    themselves, with the seed EpisodeReporter saw.
+    Every bird flies the same with or without the others, so the replay shows exactly what
+    happened in training, and the evaluation itself does not pay for the recording.
+    """
+    def __init__(self, episodes, settings, topCount, directory=REPLAY_DIR, keep=20):
+        self.episodes = episodes
+        self.settings = settings
+        self.topCount = topCount
+        self.directory = directory
+        self.keep = keep
+        self.generation = None
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def post_evaluate(self, config, population, species, best_genome):
+        if not self.episodes.episodes:
+            return
+        seed = self.episodes.episodes[0]['seed']
+        genomes = sorted(population.values(), key=lambda genome: genome.fitness, reverse=True)[:self.topCount]
+        recorder = replay.ReplayRecorder()
+        _, episode = playPopulation([NETWORK_CACHE.create(genome, config) for genome in genomes], headless=True, seed=seed,
+                                    birdIds=[genome.key for genome in genomes], recorder=recorder, maxTicks=self.settings['max_ticks'],
+                                    maxScore=self.settings['max_score'], fitnessThreshold=episodeFitnessThreshold(config, self.settings),
+                                    decisionInterval=self.settings['decision_interval'], decisionEvents=self.settings['decision_events'])
+        replay.saveReplay(os.path.join(self.directory, f"generation-{self.generation:04d}.replay"), {
+            'generation': self.generation,
+            'seed': seed,
+            'birdIds': [genome.key for genome in genomes],
+            'fitness': [genome.fitness for genome in genomes],
+            'stopReason': episode['stopReason']
+        }, recorder.columns())
+        for oldPath in replay.listReplays(self.directory)[:-self.keep]:
+            os.remove(oldPath)
+
+# Environment
+class FlappyEnv:
+    """
+    The game as a reset/step environment for a batch of birds, shared by training, manual play
+    and best genome replay.
+
+    Each step takes one (jump, highJump) pair of booleans per bird and returns the observations,
+    rewards and dones of every bird. An observation holds the network inputs: the bird's y, its
+    distance to the top and bottom of the next wall, the wall's height, whether wind is incoming
+    and whether wind is active. Rewards add up to the training fitness. The episode is over once
+    every bird is done. A ProfileReporter passed as 'profiler' gets the time of each phase.
+
+    When rendering, every 'renderEvery'th tick is drawn. By default the game then waits so it
+    runs at 30 frames per second. With 'displayFps' the game runs at full speed instead and a
+    tick is only drawn once 1/displayFps seconds have passed since the last drawn frame, so
+    watching costs a bounded share of the time. A replay.ReplayRecorder passed as 'recorder' gets the
+    state of every tick.
+    """
+    def __init__(self, birdCount=1, render=False, wind=True, isModeTraning=False, generation=None, firstWallX=400, profiler=None, renderEvery=1, displayFps=0, recorder=None):
+        self.birdCount = birdCount
+        self.recorder = recorder
+        self.profiler = profiler
+        self.firstWallX = firstWallX
+        self.render = render
+        self.wind = wind
+        self.isModeTraning = isModeTraning
+        self.generation = generation
+        self.renderEvery = renderEvery
+        self.displayFps = displayFps
+        if render:
+            loadAssets()
+            pygame.init()
+            self.window = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+            buildRenderCache()
+            self.clock = pygame.time.Clock()
+            self.font = pygame.font.SysFont("comicsans", 50)
+
+    def reset(self, seed=None, birdIds=None, course=None):
+        """
+        Start a new episode and return the first observations.
+        'seed' picks the walls and wind, 'birdIds' the wind of each bird and 'course'
+        is the episode's precomputed course if the caller already has it.
+        """
+        self.streams = createRandomStreams(seed)
+        self.course = createCourse(self.streams['seed']) if course is None else course
+        # All birds live in one set of arrays; a bird keeps its index for the whole episode.
+        self.population = createPopulation(self.birdCount, 230, 350, birdIds)
+        self.Ground = createGround(730)
+        self.walls = [createWall(self.firstWallX, int(self.course[0]))]
+        self.wallCount = 1
+        self.score = 0
+        self.tick = 0
+        self.lastFrameTime = 0
+        self.drewFrame = True
+        return self.advance()
+
+    def step(self, actions):
+        """
+        Apply one (jump, highJump) action per bird, play out the rest of the tick and move
+        the birds for the next one. Returns (observations, rewards, dones).
+        """
+        profiler = self.profiler
+        if profiler:
+            start = time.perf_counter()
+            profiler.ticks += 1
+        population = self.population
+        alive = population['alive']
+        actions = np.asarray(actions, dtype=bool)
+        rewards = np.zeros(self.birdCount)
+        rewards[alive] += 0.6  # Reward for staying alive
+
+        highJumping = alive & actions[:, 1]
+        populationHighJump(population, highJumping)
+        rewards[highJumping] += 0.2
+        population['highJumpActive'][alive & ~highJumping] = False
+
+        populationJump(population, alive & actions[:, 0])
+
+        moveGround(self.Ground)
+        if profiler:
+            start = profiler.lap('actions', start)
 
         addWall = False
-        for wall in walls:
-            for birdIndex, bird in enumerate(birds):
-                if wallCollide(wall, bird):
-                    genomeList[birdIndex].fitness -= 5
-                    birds.pop(birdIndex)
-                    networks.pop(birdIndex)
-                    genomeList.pop(birdIndex)
-                    continue
+        for wall in self.walls:
+            collided = populationWallCollide(population, wall)
+            rewards[collided] -= 5
+            alive[collided] = False
 
-                if not wall['passed'] and wall['x'] < bird['x']:
-                    wall['passed'] = True
-                    score += 1
-                    for genome in genomeList:
-                        genome.fitness += 5
-                    addWall = True
-
-                #Punish the birds that fly off into the sky.
-                if bird['y'] < 0 or bird['y'] + bird['image'].get_height() >= Ground['y']:
-                    genomeList[birdIndex].fitness -= 5
-                    birds.pop(birdIndex)
-                    networks.pop(birdIndex)
-                    genomeList.pop(birdIndex)
-                    continue
+            if not wall['passed'] and wall['x'] < population['x'] and alive.any():
+                wall['passed'] = True
+                self.score += 1
+                rewards[alive] += 5
+                addWall = True
+
+            #Punish the birds that fly off into the sky.
+            outOfBounds = populationOutOfBounds(population, self.Ground)
+            rewards[outOfBounds] -= 5
+            alive[outOfBounds] = False
 
             moveWall(wall)
+        if profiler:
+            start = profiler.lap('wallCollide', start)
 
         if addWall:
-            walls.append(createWall(walls[-1]['x'] + 400))  # Fixed gap between walls
+            if self.wallCount == len(self.course):
+                self.course = createCourse(self.streams['seed'], 2 * len(self.course))
+            self.walls.append(createWall(self.walls[-1]['x'] + 400, int(self.course[self.wallCount])))  # Fixed gap between walls
+            self.wallCount += 1
+
+        self.walls = [wall for wall in self.walls if wall['x'] + WALL_WIDTH > 0]
+
+        alive[populationOutOfBounds(population, self.Ground)] = False
+        if profiler:
+            start = profiler.lap('listRebuilds', start)
+
+        if self.wind:
+            populationApplyWind(population, self.streams)
+        if profiler:
+            start = profiler.lap('applyWindEffect', start)
+        populationAnimate(population, self.isModeTraning)
+        if profiler:
+            profiler.lap('birdAnimate', start)
+
+        if self.recorder:
+            self.recorder.record(self, actions)
+
+        self.tick += 1
+        self.drewFrame = self.render and self.frameDue()
+        if self.drewFrame:
+            self.draw()
+
+        return self.advance(), rewards, ~alive
+
+    def advance(self):
+        """
+        Move the birds for the next tick and return what their networks get to see.
+        """
+        population = self.population
+        wall_Index = 0
+        if len(self.walls) > 1 and population['x'] > self.walls[0]['x'] + WALL_WIDTH:
+            wall_Index = 1
+        wall = self.walls[wall_Index]
+        # The number of the wall the birds look at and whether it has reached them, which only
+        # changes when a new wall comes into play
+        self.wallStage = (self.wallCount - len(self.walls) + wall_Index, wall['x'] < population['x'] + BIRD_WIDTH)
+
+        profiler = self.profiler
+        if profiler:
+            start = time.perf_counter()
+        populationMove(population)
+        if profiler:
+            start = profiler.lap('birdMove', start)
+
+        y = population['y']
+        observations = np.column_stack((
+            y,
+            np.abs(y - wall['height']),
+            np.abs(y - wall['bottom']),
+            np.full(len(y), wall['height']),
+            population['windTimer'] > 12,  # Wind incoming in approximately 0.4 seconds
+            population['windActive']
+        ))
+        if profiler:
+            profiler.lap('observations', start)
+        return observations
+
+    def frameDue(self):
+        """
+        Check whether the tick that was just played should be drawn.
+        """
+        if self.tick % self.renderEvery:
+            return False
+        return not self.displayFps or time.perf_counter() - self.lastFrameTime >= 1 / self.displayFps
+
+    def draw(self):
+        """
+        Draw the current state of the episode, at most 30 frames per second unless 'displayFps' is set.
+        """
+        profiler = self.profiler
+        if profiler:
+            start = time.perf_counter()
+        if not self.displayFps:
+            self.clock.tick(30)
+        self.lastFrameTime = time.perf_counter()
+        if profiler:
+            start = profiler.lap('frameCap', start)
+        population = self.population
+        alive = population['alive']
 
-        walls = [wall for wall in walls if wall['x'] + wall['WALL_TOP'].get_width() > 0]
+        # Collect indices of genomes with active states
+        windActiveGenomes = np.flatnonzero(alive & population['windActive']).tolist()
+        highJumpActiveGenomes = np.flatnonzero(alive & population['highJumpActive']).tolist()
+        windIncomingGenomes = np.flatnonzero(alive & (population['windTimer'] > 12)).tolist()
+        if profiler:
+            start = profiler.lap('stateIndices', start)
+
+        drawWindow(self.window, self.walls, populationBirds(population), self.Ground, self.score, self.font, windActiveGenomes=windActiveGenomes, highJumpActiveGenomes=highJumpActiveGenomes, windIncomingGenomes=windIncomingGenomes, generation=self.generation, isModeTraning=self.isModeTraning)
+        if profiler:
+            profiler.lap('drawWindow', start)
+
+# Decision schedule
+class DecisionSchedule:
+    """
+    Decides on which ticks the networks of a FlappyEnv's birds are asked for actions; on the other
+    ticks the birds repeat their last action. Every bird is asked every 'interval' ticks, so the
+    networks can still be activated as one batch. With 'events' every bird is also asked as soon as
+    a new wall comes into play, which restarts the interval, and a bird whose wind starts is asked
+    on its own in between. The walls are the same for every bird and a bird's wind only depends on
+    its id, so a bird is asked on the same ticks whichever birds share its episode.
+    """
+    def __init__(self, interval=1, events=False):
+        if interval < 1:
+            raise ValueError(f"The decision interval must be at least 1 tick, not {interval}")
+        self.interval = interval
+        self.events = events
+        self.ticksLeft = 0
+        self.wallStage = None
+        self.windActive = None
+        self.decisions = 0
+        self.eventDecisions = 0
+
+    def next(self, env):
+        """
+        Move on to the tick 'env' is about to play. Returns True with None when every bird is asked,
+        otherwise False with the indices of the living birds asked on their own, usually none.
+        """
+        population = env.population
+        windStarted = None
+        if self.events and self.windActive is not None:
+            windStarted = population['alive'] & population['windActive'] & ~self.windActive
+        if self.events:
+            self.windActive = population['windActive'].copy()
+
+        self.ticksLeft -= 1
+        if self.ticksLeft <= 0 or (self.events and env.wallStage != self.wallStage):
+            self.ticksLeft = self.interval
+            self.wallStage = env.wallStage
+            self.decisions += 1
+            return True, None
+        birdIndices = np.flatnonzero(windStarted) if windStarted is not None else np.zeros(0, dtype=int)
+        self.eventDecisions += len(birdIndices)
+        return False, birdIndices
+
+def playPopulation(networks, headless=False, seed=None, birdIds=None, course=None, profiler=None, maxTicks=0, maxScore=0, fitnessThreshold=None, renderEvery=1, displayFps=0, recorder=None,
+                   decisionInterval=1, decisionEvents=False):
+    """
+    Let one bird per network play the game until all of them are dead, or until 'Q' is pressed.
+    'seed' picks the walls and wind of the episode and 'birdIds' the wind of each bird.
+    'course' is the episode's precomputed course if the caller already has it.
+    'profiler' is an optional ProfileReporter that gets the time of each phase.
+    The episode also stops after 'maxTicks' ticks, at a score of 'maxScore' (0 means no limit)
+    or once a bird reaches 'fitnessThreshold', since the run is over after this generation then.
+    'renderEvery' and 'displayFps' decide which ticks are drawn, and 'recorder' records them, like in FlappyEnv.
+    The networks are asked for actions on the ticks a DecisionSchedule with 'decisionInterval' and
+    'decisionEvents' picks, and the birds repeat their last action in between. Rewards are still
+    counted every tick, so the fitness stays comparable between intervals.
+    Returns the fitness of every bird and an episode dict with its seed, ticks, score, 'stopReason',
+    which is None when every bird died, the number of ticks the networks were asked on in 'decisions'
+    and the number of birds asked on their own in 'eventDecisions'.
+    """
+    if profiler:
+        start = time.perf_counter()
+    env = FlappyEnv(len(networks), render=not headless, isModeTraning=True, generation=generation, profiler=profiler, renderEvery=renderEvery, displayFps=displayFps, recorder=recorder)
+    observations = env.reset(seed, birdIds, course)
+    alive = env.population['alive']
+    fitness = np.zeros(len(networks))
+    compiledIndices = np.arange(len(networks))
+    compiled = compileNetworks(networks)
+    schedule = DecisionSchedule(decisionInterval, decisionEvents)
+    actions = np.zeros((len(networks), 2), dtype=bool)
+    if profiler:
+        profiler.lap('setup', start)
+
+    stopReason = None
+    ticks = 0
+    
+    while alive.any():
+        if profiler:
+            start = time.perf_counter()
+        # Events are only read after drawn frames, they wait in the queue until then
+        if not headless and env.drewFrame:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    quit()
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_q:  # Press 'Q' to quit after the current generation
+                        stopReason = 'quit'
+
+        if profiler:
+            start = profiler.lap('events', start)
+
+        if stopReason:
+            break
 
-        for birdIndex, bird in enumerate(birds):
-            if bird['y'] + bird['image'].get_height() >= Ground['y'] or bird['y'] < 0:
-                birds.pop(birdIndex)
-                networks.pop(birdIndex)
-                genomeList.pop(birdIndex)
+        everyBird, birdIndices = schedule.next(env)
+        if everyBird:
+            # Drop the dead birds' networks once most of the compiled ones belong to dead birds
+            if np.count_nonzero(alive) < len(compiledIndices) // 2:
+                compiledIndices = np.flatnonzero(alive)
+                compiled = compileNetworks([networks[birdIndex] for birdIndex in compiledIndices])
 
-        applyWindEffect(birds)
+            outputs = np.zeros((len(networks), 2))
+            outputs[compiledIndices] = activateNetworks(compiled, observations[compiledIndices])
+            actions = outputs > 0.5
+        else:
+            for birdIndex in birdIndices:
+                actions[birdIndex] = np.array(networks[birdIndex].activate(observations[birdIndex])) > 0.5
+        if profiler:
+            profiler.lap('activation', start)
+
+        observations, rewards, _ = env.step(actions)
+        fitness += rewards
+        ticks += 1
+
+        if maxTicks and ticks >= maxTicks:
+            stopReason = 'maxTicks'
+        elif maxScore and env.score >= maxScore:
+            stopReason = 'maxScore'
+        elif fitnessThreshold is not None and fitness.max() >= fitnessThreshold:
+            stopReason = 'fitnessThreshold'
+        if stopReason:
+            break
 
-        # Collect indices of genomes with active states
-        windActiveGenomes = [i for i, bird in enumerate(birds) if bird['windActive']]
-        highJumpActiveGenomes = [i for i, bird in enumerate(birds) if bird['highJumpActive']]
-        windIncomingGenomes = [i for i, bird in enumerate(birds) if bird['windTimer'] > 12]
+    return fitness, {'seed': env.streams['seed'], 'ticks': ticks, 'score': env.score, 'stopReason': stopReason,
+                     'decisions': schedule.decisions, 'eventDecisions': schedule.eventDecisions}
 
-        # Call drawWindow with the collected indices
-        drawWindow(window, walls, birds, Ground, score, font, windActiveGenomes=windActiveGenomes, highJumpActiveGenomes=highJumpActiveGenomes, windIncomingGenomes=windIncomingGenomes, generation=generation, isModeTraning=True)
+# Parallel evaluation
+def playGenomes(genomes, config, seed, settings, course=None):
+    """
+    Play one headless episode seeded with 'seed' for a list of genomes and return their fitness
+    and the episode dict. Without 'course' the course is drawn from the seed.
+    """
+    networks = [NETWORK_CACHE.create(genome, config) for genome in genomes]
+    fitness, episode = playPopulation(networks, headless=True, seed=seed, birdIds=[genome.key for genome in genomes], course=course,
+                                      maxTicks=settings['max_ticks'], maxScore=settings['max_score'], fitnessThreshold=episodeFitnessThreshold(config, settings),
+                                      decisionInterval=settings['decision_interval'], decisionEvents=settings['decision_events'])
+    return fitness.tolist(), episode
 
-    # Save the best genome to a file
-    if stop_training:
-        winner = max(genomes, key=lambda g: g[1].fitness)
-        if winner[1].fitness >= FITNESS_THRESHOLD:
-            with open('winner.pkl', 'wb') as output:
-                pickle.dump(winner[1], output, 1)
-            print("Best genome saved to winner.pkl")
+def evaluateGenomes(genomes, config, seed, courseName, courseLength, settings):
+    """
+    playGenomes with the episode's course read from the shared memory block 'courseName'.
+    This runs inside the worker processes of ParallelEpisodeEvaluator.
+    """
+    return playGenomes(genomes, config, seed, settings, attachCourse(courseName, courseLength))
+
+class ParallelEpisodeEvaluator:
+    """
+    Evaluate a generation in a pool of worker processes, like neat.ParallelEvaluator.
+    Each chunk of 'chunkSize' genomes plays its own headless episode, so with the default
+    chunk size of 1 every genome plays alone. All chunks of a generation share the episode
+    seeds, which are drawn from the seeded 'random' module, so every chunk faces the same courses
+    and each genome gets the fitness it would get in main(). Every episode of every chunk is
+    its own job, so several episodes per genome spread over all workers.
+    'settings', 'episodes' and 'fitnessCache' work like in main().
+    """
+    def __init__(self, workers, chunkSize=1, settings=None, episodes=None, fitnessCache=None):
+        self.chunkSize = chunkSize
+        self.settings = settings or DEFAULT_SETTINGS
+        self.episodes = episodes
+        self.fitnessCache = fitnessCache
+        self.pool = multiprocessing.Pool(workers)
+
+    def close(self):
+        """
+        Shut the worker processes down.
+        """
+        self.pool.close()
+        self.pool.join()
+
+    def evaluate(self, genomes, config):
+        """
+        Fitness function for population.run; sets the fitness of every genome.
+        """
+        global generation
+        generation += 1
+
+        seeds = episodeSeeds(self.settings)
+        genomeList = [genome for _, genome in genomes]
+        scores, cacheKeys = cachedScores(genomeList, seeds, self.settings, self.fitnessCache, self.episodes)
+        playing = [np.flatnonzero(np.isnan(scores[:, episodeIndex])) for episodeIndex in range(len(seeds))]
+        courses = [createCourse(seed) for seed in seeds]
+        sharedCourses = []
+        try:
+            for course in courses:
+                sharedCourses.append(shareCourse(course))
+            jobs = [(playing[episodeIndex][start:start + self.chunkSize], episodeIndex,
+                     self.pool.apply_async(evaluateGenomes, ([genomeList[genomeIndex] for genomeIndex in playing[episodeIndex][start:start + self.chunkSize]],
+                                                            config, seed, sharedCourse.name, len(course), self.settings)))
+                    for episodeIndex, (seed, course, sharedCourse) in enumerate(zip(seeds, courses, sharedCourses))
+                    for start in range(0, len(playing[episodeIndex]), self.chunkSize)]
+            for genomeIndices, episodeIndex, job in jobs:
+                fitness, episode = job.get()
+                scores[genomeIndices, episodeIndex] = fitness
+                if self.episodes:
+                    self.episodes.addEpisode(episode)
+                if self.fitnessCache:
+                    self.fitnessCache.store(cacheKeys, scores, genomeIndices, episodeIndex, episode)
+        finally:
+            for sharedCourse in sharedCourses:
+                sharedCourse.close()
+                sharedCourse.unlink()
+
+        assignFitness(genomeList, scores, self.settings, self.episodes)
+
+# Distributed evaluation
+class DistributedEvaluator(distributed.Coordinator):
+    """
+    Evaluate a generation on workers that connect over TCP from any number of hosts, started with
+    '--mode worker --coordinator host:port', see distributed.Coordinator. Like in ParallelEpisodeEvaluator
+    every chunk of 'chunkSize' genomes plays each episode seed of the generation as its own job, and the
+    workers draw the courses from the seeds, so each genome gets the fitness it would get in main().
+    'settings', 'episodes' and 'fitnessCache' work like in main().
+    """
+    def __init__(self, address, authkey=None, chunkSize=1, settings=None, episodes=None, stragglerSeconds=30.0, localWorkers=0, fitnessCache=None):
+        super().__init__(address, authkey, settings or DEFAULT_SETTINGS, playGenomes, stragglerSeconds, localWorkers)
+        self.chunkSize = chunkSize
+        self.episodes = episodes
+        self.fitnessCache = fitnessCache
+
+    def evaluate(self, genomes, config):
+        """
+        Fitness function for population.run; sets the fitness of every genome.
+        """
+        global generation
+        generation += 1
+
+        seeds = episodeSeeds(self.settings)
+        genomeList = [genome for _, genome in genomes]
+        scores, cacheKeys = cachedScores(genomeList, seeds, self.settings, self.fitnessCache, self.episodes)
+        playing = [np.flatnonzero(np.isnan(scores[:, episodeIndex])) for episodeIndex in range(len(seeds))]
+        results = self.runJobs(config, {(episodeIndex, start): ([genomeList[genomeIndex] for genomeIndex in playing[episodeIndex][start:start + self.chunkSize]], seed)
+                                        for episodeIndex, seed in enumerate(seeds) for start in range(0, len(playing[episodeIndex]), self.chunkSize)})
+
+        for (episodeIndex, start), (fitness, episode) in sorted(results.items()):
+            genomeIndices = playing[episodeIndex][start:start + len(fitness)]
+            scores[genomeIndices, episodeIndex] = fitness
+            if self.episodes:
+                self.episodes.addEpisode(episode)
+            if self.fitnessCache:
+                self.fitnessCache.store(cacheKeys, scores, genomeIndices, episodeIndex, episode)
+        assignFitness(genomeList, scores, self.settings, self.episodes)
 
 # Function to ask for mode
 def askMode():
     """
     Ask the user to select a mode: train or play.
     """
+    loadAssets()
     pygame.init()
     window = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
     font = pygame.font.SysFont("comicsans", 30)
@@ -443,18 +1805,12 @@ def playGame():
     """
     Function to play the game manually.
     """
-    pygame.init()
-    window = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-    clock = pygame.time.Clock()
-    bird = createBird(230, 350)
-    Ground = createGround(730)
-    walls = [createWall(600)]
-    score = 0
-    font = pygame.font.SysFont("comicsans", 50)
+    env = FlappyEnv(render=True, wind=False, firstWallX=600)
+    env.reset()
     run = True
 
     while run:
-        clock.tick(30)
+        action = [False, False]
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 run = False
@@ -462,199 +1818,420 @@ def playGame():
                 quit()
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_SPACE:
-                    birdJump(bird)
+                    action[0] = True
                 elif event.key == pygame.K_h:  # Assuming 'H' key is used for high jump
-                    birdHighJump(bird,bird['windActive'])
-
-        birdMove(bird)
-        moveGround(Ground)
-
-        addWall = False
-        for wall in walls:
-            moveWall(wall)
-            if wallCollide(wall, bird):
-                run = False
-            if not wall['passed'] and wall['x'] < bird['x']:
-                wall['passed'] = True
-                score += 1
-                addWall = True
-
-        if addWall:
-            walls.append(createWall(walls[-1]['x'] + 400))  # Fixed gap between walls
-
-        walls = [wall for wall in walls if wall['x'] + wall['WALL_TOP'].get_width() > 0]
+                    action[1] = True
 
-        if bird['y'] + bird['image'].get_height() >= Ground['y'] or bird['y'] < 0:
-            run = False
+        _, _, dones = env.step([action])
+        run = not dones[0]
 
-        # applyWindEffect([bird])
-
-        windActiveGenomes = [0] if bird['windActive'] else []
-        highJumpActiveGenomes = [0] if bird['highJumpActive'] else []
-        windIncomingGenomes = [0] if bird['windTimer'] > 12 else []
-
-        drawWindow(window, walls, [bird], Ground, score, font, windActiveGenomes=windActiveGenomes, highJumpActiveGenomes=highJumpActiveGenomes, windIncomingGenomes=windIncomingGenomes)          
-
-def run(configPath):
+def run(configPath, headless=False, seed=None, workers=None, chunkSize=1, profile=False, profileCsv=None, settings=None, resume=None, coordinator=None):
     """
     This function sets up and runs the NEAT evolutionary process.
     It uses the configuration file specified by 'configPath' to determine
     how networks are structured and evolved.
+    'headless' trains without a window or frame cap, and 'seed' makes the run reproducible.
+    With 'workers' the genomes play their own headless episodes, 'chunkSize' at a time,
+    in that many processes.
+    'profile' prints the time spent in each phase of every generation, and 'profileCsv'
+    also appends it to that CSV file.
+    'settings' are the game settings, read from the config file when left out.
+    With 'resume' training continues from that checkpoint file instead of a new population,
+    and a checkpoint is saved every 'checkpoint_interval' generations.
+    With a 'coordinator' address the genomes are played by workers connecting to it over TCP,
+    'chunkSize' per job, and 'workers' of them are started on this machine.
+    With a 'course_seed' every generation plays the same courses, and a FitnessCache of
+    'fitness_cache_size' scores spares unchanged genomes from playing them again.
     """
-    config = neat.config.Config(
-        neat.DefaultGenome,
-        neat.DefaultReproduction,
-        neat.DefaultSpeciesSet,
-        neat.DefaultStagnation,
-        configPath
-    )
-
-    population = neat.Population(config)
+    if seed is not None:
+        random.seed(seed)
+    if settings is None:
+        settings = loadSettings(configPath)
+
+    if resume:
+        population, reporters = restoreCheckpoint(resume)
+        episodes, = reporters
+        config = population.config
+        print(f"Resuming from {resume} at generation {population.generation}")
+    else:
+        config = loadConfig(configPath, settings['species_set'])
+        population = neat.Population(config)
+        episodes = EpisodeReporter()
 
     population.add_reporter(neat.StdOutReporter(True))
-    stats = neat.StatisticsReporter()
-    population.add_reporter(stats)
-
-    # Run for up to 300 generations.
-    winner = population.run(main, 300 )
+    population.add_reporter(episodes)
+    if settings['telemetry_file']:
+        population.add_reporter(TelemetryReporter(settings['telemetry_file'], episodes, settings['telemetry_max_bytes'], settings['telemetry_backups']))
+    checkpointer = None
+    if settings['checkpoint_interval']:
+        checkpointer = AsyncCheckpointer(population, (episodes,), settings['checkpoint_interval'], keep=settings['checkpoint_keep'])
+        population.add_reporter(checkpointer)
+    if settings['replay_top_k']:
+        population.add_reporter(ReplayReporter(episodes, settings, settings['replay_top_k'], keep=settings['replay_keep']))
+    profiler = None
+    if profile or profileCsv:
+        profiler = ProfileReporter(profileCsv)
+        population.add_reporter(profiler)
+
+    fitnessCache = None
+    if settings['course_seed'] and settings['fitness_cache_size']:
+        fitnessCache = FitnessCache(settings['fitness_cache_size'])
+
+    # Run for up to 300 generations, counting the ones before the checkpoint.
+    try:
+        if coordinator or workers:
+            if coordinator:
+                evaluator = DistributedEvaluator(coordinator, distributed.readAuthkey(), chunkSize, settings, episodes, settings['straggler_seconds'], workers or 0, fitnessCache)
+            else:
+                evaluator = ParallelEpisodeEvaluator(workers, chunkSize, settings, episodes, fitnessCache)
+            try:
+                winner = population.run(evaluator.evaluate, 300 - population.generation)
+            finally:
+                evaluator.close()
+        else:
+            winner = population.run(lambda genomes, config: main(genomes, config, headless=headless, profiler=profiler, settings=settings, episodes=episodes,
+                                                                 fitnessCache=fitnessCache), 300 - population.generation)
+    finally:
+        if checkpointer:
+            checkpointer.close()
 
     # 'winner' now holds the best genome found during the run. 
     # save the winner to a file
-    with open('winner.pkl', 'wb') as output:
-        pickle.dump(winner, output, 1)
+    saveWinner(winner, config, settings)
+    if settings['telemetry_file']:
+        print(f"Plot the fitness trend with: python main.py --mode plot --telemetry {settings['telemetry_file']}")
 
-    print("Best genome saved to winner.pkl")
+def exportPolicy(genome, config, path=POLICY_PATH, decisionInterval=1, decisionEvents=False):
+    """
+    Write the network of 'genome' as a policy file, which policy.py runs without neat or pickle,
+    along with the 'decision_interval' and 'decision_events' it was trained with.
+    The nodes are grouped into layers by their depth like in compileNetworks and add up their links
+    in the same order, so the policy gives the same outputs as activateNetworks.
+    Raises ValueError for networks with an aggregation other than sum or an activation policy.py does not know.
+    """
+    network = neat.nn.FeedForwardNetwork.create(genome, config)
+    activationCodes = {getattr(neat.activations, name + "_activation"): code for code, name in enumerate(policy.ACTIVATION_NAMES)}
+    slots = {node: slot for slot, node in enumerate(network.input_nodes + network.output_nodes)}
+    depths = dict.fromkeys(slots, 0)
+    nodes = []
+    for node, activation, aggregation, bias, response, links in network.node_evals:
+        if aggregation is not neat.aggregations.sum_aggregation or activation not in activationCodes:
+            raise ValueError(f"Node {node} of genome {genome.key} uses an aggregation or activation a policy file cannot hold")
+        depths[node] = 1 + max((depths[source] for source, _ in links), default=0)
+        slots.setdefault(node, len(slots))
+        nodes.append((depths[node], slots[node], bias, response, activationCodes[activation], links))
+    # A stable sort keeps the evaluation order within each layer
+    nodes.sort(key=lambda node: node[0])
+    layers = [list(layer) for _, layer in itertools.groupby(nodes, key=lambda node: node[0])]
+
+    # Each layer's links as a grid of fan-in rows by node columns, padded with links from the
+    # extra slot len(slots), which the runtime keeps at 0
+    linkSources = []
+    linkWeights = []
+    for layer in layers:
+        for row in range(max(len(links) for *_, links in layer)):
+            for *_, links in layer:
+                source, weight = links[row] if row < len(links) else (None, 0.0)
+                linkSources.append(len(slots) if source is None else slots[source])
+                linkWeights.append(weight)
+    layerCodes = [{code for _, _, _, _, code, _ in layer} for layer in layers]
+
+    arrays = {
+        'outputSlots': [slots[node] for node in network.output_nodes],
+        'layerStarts': np.cumsum([0] + [len(layer) for layer in layers]),
+        'layerFanIn': [max(len(links) for *_, links in layer) for layer in layers],
+        'layerActivation': [min(codes) if len(codes) == 1 else policy.MIXED_ACTIVATIONS for codes in layerCodes],
+        'nodeSlots': [slot for _, slot, _, _, _, _ in nodes],
+        'bias': [bias for _, _, bias, _, _, _ in nodes],
+        'response': [response for _, _, _, response, _, _ in nodes],
+        'activation': [code for _, _, _, _, code, _ in nodes],
+        'linkSources': linkSources,
+        'linkWeights': linkWeights
+    }
+    fitness = float('nan') if genome.fitness is None else genome.fitness
+    policy.savePolicy(path, arrays, len(network.input_nodes), len(slots), genome.key, fitness, decisionInterval, decisionEvents)
 
-    # ==== PLOT THE FITNESS TREND ====
-    plot_statistics(stats)
+def saveWinner(genome, config, settings):
+    """
+    Save the best genome to WINNER_PATH, and its network to POLICY_PATH for policy.py.
+    Both record the 'decision_interval' and 'decision_events' of 'settings', so playBestGenome
+    asks the network as often as training did.
+    When the network cannot be a policy file the one of an earlier winner is removed,
+    so playBestGenome does not play that one instead.
+    """
+    genome.decisionInterval = settings['decision_interval']
+    genome.decisionEvents = settings['decision_events']
+    with open(WINNER_PATH, 'wb') as output:
+        pickle.dump(genome, output, 1)
+    try:
+        exportPolicy(genome, config, POLICY_PATH, genome.decisionInterval, genome.decisionEvents)
+        print(f"Best genome saved to {WINNER_PATH} and {POLICY_PATH}")
+    except ValueError as error:
+        if os.path.exists(POLICY_PATH):
+            os.remove(POLICY_PATH)
+        print(f"Best genome saved to {WINNER_PATH}, but not as a policy: {error}")
+
+def exportWinner(configPath):
+    """
+    Export the genome in WINNER_PATH to POLICY_PATH, for winners saved before training wrote policy files.
+    """
+    with open(WINNER_PATH, "rb") as winnerFile:
+        genome = pickle.load(winnerFile)
+    settings = loadSettings(configPath)
+    config = loadConfig(configPath, settings['species_set'])
+    exportPolicy(genome, config, POLICY_PATH, *decisionSettings(genome, settings))
+    print(f"{WINNER_PATH} exported to {POLICY_PATH} ({os.path.getsize(POLICY_PATH)} bytes)")
+
+def decisionSettings(winner, settings):
+    """
+    Get the decision interval and events flag a winner, a genome or a policy.Policy, was trained with,
+    falling back to the 'decision_interval' and 'decision_events' of 'settings' for winners saved
+    before they were recorded.
+    """
+    decisionInterval = getattr(winner, 'decisionInterval', None)
+    decisionEvents = getattr(winner, 'decisionEvents', None)
+    return (settings['decision_interval'] if decisionInterval is None else decisionInterval,
+            settings['decision_events'] if decisionEvents is None else decisionEvents)
 
 #Function to play the game using the best genome
 def playBestGenome(configPath):
     """
     Load the best genome from a file and use it to play the game.
+    The policy file is used when there is one, which needs neither the config nor unpickling.
+    The network decides as often as in training, see decisionSettings.
     """
-    try:
-        # Load the best genome from the file
-        with open("winner.pkl", "rb") as f:
-            best_genome = pickle.load(f)
-    except FileNotFoundError:
-        print("Best genome file not found. Please run the training first.")
-        return
+    settings = loadSettings(configPath)
+    if os.path.exists(POLICY_PATH):
+        winner = policy.loadPolicy(POLICY_PATH)
+        activate = winner.activateOne
+    else:
+        try:
+            # Load the best genome from the file
+            with open(WINNER_PATH, "rb") as f:
+                best_genome = pickle.load(f)
+        except FileNotFoundError:
+            print("Best genome file not found. Please run the training first.")
+            return
 
-    config = neat.config.Config(
-        neat.DefaultGenome,
-        neat.DefaultReproduction,
-        neat.DefaultSpeciesSet,
-        neat.DefaultStagnation,
-        configPath
-    )
+        config = loadConfig(configPath, settings['species_set'])
 
-    # Create a neural network from the best genome
-    net = neat.nn.FeedForwardNetwork.create(best_genome, config)
+        # Create a neural network from the best genome
+        winner = best_genome
+        activate = neat.nn.FeedForwardNetwork.create(best_genome, config).activate
 
     # Initialize the game
-    pygame.init()
-    window = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-    bird = createBird(230, 350)
-    Ground = createGround(730)
-    walls = [createWall(600)]
-    clock = pygame.time.Clock()
-    score = 0
-    font = pygame.font.SysFont("comicsans", 50)
+    env = FlappyEnv(render=True, firstWallX=600)
+    observations = env.reset()
+    schedule = DecisionSchedule(*decisionSettings(winner, settings))
     run = True
 
     while run:
-        clock.tick(30)
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 run = False
                 pygame.quit()
                 quit()
-        
-
-        birdMove(bird)
-        moveGround(Ground)
-
-        addWall = False
-        for wall in walls:
-            moveWall(wall)
-            if wallCollide(wall, bird):
-                run = False
-            if not wall['passed'] and wall['x'] < bird['x']:
-                wall['passed'] = True
-                score += 1
-                addWall = True
-
-        if addWall:
-            walls.append(createWall(walls[-1]['x'] + 400))  # Fixed gap between walls
-
-        walls = [wall for wall in walls if wall['x'] + wall['WALL_TOP'].get_width() > 0]
-
-        if bird['y'] + bird['image'].get_height() >= Ground['y'] or bird['y'] < 0:
-            run = False
-
-        applyWindEffect([bird])
-
-        windActiveGenomes = [0] if bird['windActive'] else []
-        highJumpActiveGenomes = [0] if bird['highJumpActive'] else []
-        windIncomingGenomes = [0] if bird['windTimer'] > 12 else []
-
-        # Use the neural network to control the bird
-        if len(walls) > 1 and bird['x'] > walls[0]['x'] + walls[0]['WALL_TOP'].get_width():
-            wall_Index = 1
-        else:
-            wall_Index = 0
-
-        windIncoming = 1 if bird['windTimer'] > 12 else 0  # Wind incoming in approximately 0.4 seconds
-        inputs = (bird['y'], abs(bird['y'] - walls[wall_Index]['height']), abs(bird['y'] - walls[wall_Index]['bottom']), walls[wall_Index]['height'], windIncoming, int(bird['windActive']))
-        output = net.activate(inputs)
-        highJumpOutput = output[1]
-        jumpOutput = output[0]
 
-        if highJumpOutput > 0.5:
-            birdHighJump(bird, bird['windActive'])
-        else:
-            bird['highJumpActive']  = False
+        # Use the neural network to control the bird, repeating its action between decisions
+        everyBird, birdIndices = schedule.next(env)
+        if everyBird or len(birdIndices):
+            output = activate(observations[0].tolist())
+            action = [[output[0] > 0.5, output[1] > 0.5]]
+        observations, _, dones = env.step(action)
+        run = not dones[0]
 
-        if jumpOutput > 0.5:
-            birdJump(bird)
+def playReplay(path, speed=1.0):
+    """
+    Watch a replay file at 30 frames per second, moving 'speed' ticks per frame.
+    SPACE pauses, LEFT and RIGHT step back and forward one tick (ten with SHIFT),
+    UP and DOWN double and halve the speed, HOME goes back to the start and Q or ESC quits.
+    """
+    metadata, columns = replay.loadReplay(path)
+    tickCount = len(columns['score'])
+    if not tickCount:
+        print(f"{path} has no ticks to show.")
+        return
+    birdIds = metadata['birdIds']
 
-        drawWindow(window, walls, [bird], Ground, score, font, windActiveGenomes=windActiveGenomes, highJumpActiveGenomes=highJumpActiveGenomes, windIncomingGenomes=windIncomingGenomes)
+    loadAssets()
+    pygame.init()
+    window = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+    buildRenderCache()
+    clock = pygame.time.Clock()
+    font = pygame.font.SysFont("comicsans", 50)
+    position = 0.0
+    paused = False
 
-def plot_statistics(stats):
-    # "stats" is a neat.StatisticsReporter object
+    while True:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                return
+            if event.type == pygame.KEYDOWN:
+                step = 10 if event.mod & pygame.KMOD_SHIFT else 1
+                if event.key in (pygame.K_q, pygame.K_ESCAPE):
+                    pygame.quit()
+                    return
+                elif event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key == pygame.K_RIGHT:
+                    position, paused = position + step, True
+                elif event.key == pygame.K_LEFT:
+                    position, paused = position - step, True
+                elif event.key == pygame.K_UP:
+                    speed *= 2
+                elif event.key == pygame.K_DOWN:
+                    speed /= 2
+                elif event.key == pygame.K_HOME:
+                    position = 0.0
+        position = min(max(position, 0.0), tickCount - 1)
+        tick = int(position)
+
+        flags = columns['flags'][tick]
+        alive = (flags & replay.REPLAY_ALIVE) > 0
+        windActive = alive & ((flags & replay.REPLAY_WIND_ACTIVE) > 0)
+        highJumpActive = alive & ((flags & replay.REPLAY_HIGH_JUMP_ACTIVE) > 0)
+        windTimer = columns['windTimer'][tick]
+        birds = [{
+            'x': 230,
+            'y': float(columns['y'][tick, birdIndex]),
+            'tilt': int(columns['tilt'][tick, birdIndex]),
+            'imageIndex': int(columns['imageIndex'][tick, birdIndex]),
+            'windActive': windActive[birdIndex],
+            'windTimer': int(windTimer[birdIndex])
+        } for birdIndex in np.flatnonzero(alive)]
+        walls = [createWall(int(x), int(height)) for x, height in columns['walls'][tick] if height >= 0]
+        Ground = createGround(730)
+        Ground['x1'], Ground['x2'] = (int(x) for x in columns['ground'][tick])
+
+        pygame.display.set_caption(f"Replay of generation {metadata['generation']}: tick {tick + 1}/{tickCount} at {speed:g}x{' (paused)' if paused else ''}")
+        drawWindow(window, walls, birds, Ground, int(columns['score'][tick]), font,
+                   windActiveGenomes=[birdIds[birdIndex] for birdIndex in np.flatnonzero(windActive)],
+                   highJumpActiveGenomes=[birdIds[birdIndex] for birdIndex in np.flatnonzero(highJumpActive)],
+                   windIncomingGenomes=[birdIds[birdIndex] for birdIndex in np.flatnonzero(alive & (windTimer > 12))],
+                   generation=metadata['generation'])
+        if not paused:
+            position += speed
+        clock.tick(30)
 
-    # Extract the best fitness per generation from 'most_fit_genomes'
-    generation_best_fitness = [genome.fitness for genome in stats.most_fit_genomes]
+def plot_statistics(telemetryPath, outputPath=None):
+    # "telemetryPath" is the file written by TelemetryReporter, which can be plotted during or after training
+    # matplotlib is slow to import, and only needed for the plot
+    import matplotlib.pyplot as plt
 
-    # Extract the average fitness per generation
-    generation_mean_fitness = stats.get_fitness_mean()
+    records = readTelemetry(telemetryPath)
+    if not records:
+        print(f"No telemetry found in {telemetryPath}. Train first.")
+        return
 
-    # Let’s create x values which correspond to generation indices
-    generations = range(len(generation_best_fitness))
+    # Extract the best, average and spread of the fitness per generation
+    generations = [record['generation'] for record in records]
+    generation_best_fitness = [record['bestFitness'] for record in records]
+    generation_mean_fitness = np.array([record['meanFitness'] for record in records])
+    generation_std_fitness = np.array([record['stdFitness'] for record in records])
 
     # Plot best and average fitness over generations
     plt.figure(figsize=(8, 6))
     plt.plot(generations, generation_best_fitness, label='Best Fitness')
     plt.plot(generations, generation_mean_fitness, label='Average Fitness')
+    plt.fill_between(generations, generation_mean_fitness - generation_std_fitness, generation_mean_fitness + generation_std_fitness,
+                     alpha=0.2, label='Standard Deviation')
     
     plt.title('Fitness over Generations')
     plt.xlabel('Generation')
     plt.ylabel('Fitness')
     plt.legend(loc='best')
     plt.grid(True)
-    plt.show()
+    if outputPath:
+        plt.savefig(outputPath)
+        print(f"Plot saved to {outputPath}")
+    else:
+        plt.show()
+
+def parseArguments():
+    """
+    Parse the command line options. Without '--mode' the mode is asked for in the game window.
+    """
+    parser = argparse.ArgumentParser(description="Flappy Bird AI trained with NEAT.")
+    parser.add_argument("--mode", choices=['train', 'play', 'play_best', 'replay', 'plot', 'worker', 'export'], help="Skip the mode selection screen.")
+    parser.add_argument("--headless", action="store_true", help="Train without a window and without the 30 FPS frame cap.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed the random number generator for a reproducible run.")
+    parser.add_argument("--workers", type=int, default=None, help="Evaluate genomes in this many worker processes, each in its own headless episode.")
+    parser.add_argument("--chunk-size", type=int, default=1, help="Number of genomes sharing one episode in a worker.")
+    parser.add_argument("--coordinator", default=None,
+                        help=f"HOST:PORT to listen on for workers while training, or to connect to in worker mode. The key is read from {distributed.AUTHKEY_VARIABLE}.")
+    parser.add_argument("--max-ticks", type=int, default=None, help="End every training episode after this many ticks, 0 for no limit. Overrides the config file.")
+    parser.add_argument("--max-score", type=int, default=None, help="End every training episode at this score, 0 for no limit. Overrides the config file.")
+    parser.add_argument("--render-every", type=int, default=None, help="While watching training, draw only every Nth tick. Overrides the config file.")
+    parser.add_argument("--display-fps", type=float, default=None,
+                        help="While watching training, run the game at full speed and draw this many frames per second, 0 to run at 30 ticks per second. Overrides the config file.")
+    parser.add_argument("--resume", nargs="?", const="latest", default=None,
+                        help=f"Continue training from a checkpoint file, or from the newest one in '{CHECKPOINT_DIR}' when no file is given.")
+    parser.add_argument("--build-collision-metadata", action="store_true",
+                        help=f"Rebuild {os.path.relpath(COLLISION_METADATA_PATH)} from the images, after changing one of them.")
+    parser.add_argument("--replay-top-k", type=int, default=None,
+                        help=f"Save a replay of the K fittest genomes of every generation to '{REPLAY_DIR}', 0 for none. Overrides the config file.")
+    parser.add_argument("--replay", default=None, help=f"Replay file to watch in replay mode, the newest one in '{REPLAY_DIR}' by default.")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="Ticks shown per frame in replay mode.")
+    parser.add_argument("--decision-interval", type=int, default=None,
+                        help="Ask the networks for actions every Nth tick and repeat the last action in between. Overrides the config file.")
+    parser.add_argument("--decision-events", action="store_true", default=None,
+                        help="Also ask the networks when a new wall comes into play or a bird's wind starts. Overrides the config file.")
+    parser.add_argument("--course-seed", type=int, default=None,
+                        help="Play the courses derived from this seed in every generation instead of new ones, 0 for new ones. Overrides the config file.")
+    parser.add_argument("--episodes-per-genome", type=int, default=None, help="Number of episodes every genome plays each generation. Overrides the config file.")
+    parser.add_argument("--fitness-aggregation", choices=['mean', 'min', 'quantile'], default=None,
+                        help="How the fitness of several episodes is combined. Overrides the config file.")
+    parser.add_argument("--telemetry", default=None, help="Telemetry file to write while training, or to plot in plot mode. Overrides the config file.")
+    parser.add_argument("--plot-output", default=None, help="Save the plot of plot mode to this image file instead of showing it.")
+    parser.add_argument("--profile", action="store_true", help="Print the time spent in each phase of every generation.")
+    parser.add_argument("--profile-csv", default=None, help="Also append the phase times of every generation to this CSV file.")
+    return parser.parse_args()
 
 if __name__ == "__main__":
     localDir = os.path.dirname(__file__)
     configPath = os.path.join(localDir, "ConfigFile.txt")
 
-    mode = askMode()
+    args = parseArguments()
+    if args.build_collision_metadata:
+        buildCollisionMetadata()
+        print(f"Collision metadata saved to {COLLISION_METADATA_PATH}")
+        raise SystemExit
+    mode = args.mode
+    if mode is None:
+        # There is no display to show the selection screen on when running headless
+        mode = 'replay' if args.replay else 'train' if args.headless or args.workers or args.resume or args.coordinator else askMode()
+    resume = args.resume
+    if resume == "latest":
+        checkpoints = listCheckpoints()
+        if not checkpoints:
+            raise SystemExit(f"No checkpoint found in '{CHECKPOINT_DIR}' to resume from.")
+        resume = checkpoints[-1]
+    coordinator = distributed.parseAddress(args.coordinator) if args.coordinator else None
     if mode == 'train':
-        run(configPath)
+        if coordinator and not args.workers and not distributed.readAuthkey():
+            raise SystemExit(f"A coordinator without --workers needs a key in {distributed.AUTHKEY_VARIABLE} to share with its workers.")
+        run(configPath, headless=args.headless, seed=args.seed, workers=args.workers, chunkSize=args.chunk_size, profile=args.profile, profileCsv=args.profile_csv,
+            settings=loadSettings(configPath, max_ticks=args.max_ticks, max_score=args.max_score, render_every=args.render_every, display_fps=args.display_fps,
+                                         replay_top_k=args.replay_top_k, episodes_per_genome=args.episodes_per_genome,
+                                         decision_interval=args.decision_interval, decision_events=args.decision_events, course_seed=args.course_seed,
+                                         fitness_aggregation=args.fitness_aggregation, telemetry_file=args.telemetry), resume=resume, coordinator=coordinator)
+    elif mode == 'export':
+        exportWinner(configPath)
+    elif mode == 'worker':
+        if not coordinator or not distributed.readAuthkey():
+            raise SystemExit(f"Worker mode needs --coordinator HOST:PORT and the coordinator's key in {distributed.AUTHKEY_VARIABLE}.")
+        distributed.runWorkers(coordinator, distributed.readAuthkey(), playGenomes, args.workers or 1)
     elif mode == 'play':
         playGame()
     elif mode == 'play_best':
         playBestGenome(configPath)
+    elif mode == 'replay':
+        replays = [args.replay] if args.replay else replay.listReplays(REPLAY_DIR)
+        if not replays:
+            raise SystemExit(f"No replay found in '{REPLAY_DIR}'. Train with --replay-top-k first.")
+        playReplay(replays[-1], args.replay_speed)
+    elif mode == 'plot':
+        plot_statistics(args.telemetry or loadSettings(configPath)['telemetry_file'], args.plot_output)
     else:
         print("Invalid mode selected. Please enter 'train' or 'play'.")
\ No newline at end of file
@@ -0,0 +1,244 @@
+"""
+Standalone runtime for trained policies, the networks exported from main.py as policy files.
+
+A policy file holds one feed-forward network as flat little-endian arrays behind a small versioned
+header, so loading it is one read and a few NumPy views. Only NumPy is needed, not neat-python or
+pickle, so policy files are safe to share between machines:
+
+    import policy
+    bird = policy.loadPolicy("winner.policy")
+    jump, highJump = bird.activate(observation) > 0.5
+
+'activate' takes one observation or a batch with one row per game. The network was trained to be
+asked every 'bird.decisionInterval' ticks, repeating its last action in between, and also when
+a new wall comes into play or the bird's wind starts if 'bird.decisionEvents' is set.
+"""
+import math
+import struct
+
+import numpy as np
+
+POLICY_MAGIC = b"FBPOLICY"
+POLICY_VERSION = 2
+
+# Magic, version, genome key, fitness, the counts of inputs, outputs, value slots, nodes, links and layers,
+# then the decision interval the network was trained with and whether events also asked it
+POLICY_HEADER = struct.Struct("<8sIqdIIIIIIII")
+
+# Header of version 1 files, which did not record how often the network was asked
+POLICY_HEADER_V1 = struct.Struct("<8sIqdIIIIII")
+
+# Arrays are padded to this many bytes so they can be viewed in place
+POLICY_ALIGNMENT = 8
+
+# The arrays of a policy file in file order, with their type and the header count giving their length.
+# Inputs take the first value slots and the nodes are listed layer by layer, each layer's nodes
+# being independent of each other. The links of a layer form a grid of fan-in rows by node columns,
+# listing the links of each node in its own order, padded with links of weight 0 from the extra
+# slot 'slotCount' that is always 0. A layer whose nodes share an activation has its code in
+# layerActivation, and MIXED_ACTIVATIONS otherwise.
+POLICY_ARRAYS = [
+    ('outputSlots', '<i4', 'outputCount'),
+    ('layerStarts', '<i4', 'layerCount+1'),
+    ('layerFanIn', '<i4', 'layerCount'),
+    ('layerActivation', '<u1', 'layerCount'),
+    ('nodeSlots', '<i4', 'nodeCount'),
+    ('bias', '<f8', 'nodeCount'),
+    ('response', '<f8', 'nodeCount'),
+    ('activation', '<u1', 'nodeCount'),
+    ('linkSources', '<i4', 'linkCount'),
+    ('linkWeights', '<f8', 'linkCount')
+]
+
+MIXED_ACTIVATIONS = 255
+
+# NumPy versions of neat's activation functions, by name
+ACTIVATIONS = {
+    'sigmoid': lambda z: 1.0 / (1.0 + np.exp(-np.clip(5.0 * z, -60.0, 60.0))),
+    'tanh': lambda z: np.tanh(np.clip(2.5 * z, -60.0, 60.0)),
+    'sin': lambda z: np.sin(np.clip(5.0 * z, -60.0, 60.0)),
+    'gauss': lambda z: np.exp(-5.0 * np.clip(z, -3.4, 3.4) ** 2),
+    'relu': lambda z: np.where(z > 0.0, z, 0.0),
+    'softplus': lambda z: 0.2 * np.log(1 + np.exp(np.clip(5.0 * z, -60.0, 60.0))),
+    'identity': lambda z: z,
+    'clamped': lambda z: np.clip(z, -1.0, 1.0),
+    'abs': np.abs,
+    'hat': lambda z: np.maximum(0.0, 1 - np.abs(z)),
+    'square': lambda z: z ** 2,
+    'cube': lambda z: z ** 3
+}
+
+# neat's own activation functions, for evaluating one observation without NumPy's overhead
+SCALAR_ACTIVATIONS = {
+    'sigmoid': lambda z: 1.0 / (1.0 + math.exp(-max(-60.0, min(60.0, 5.0 * z)))),
+    'tanh': lambda z: math.tanh(max(-60.0, min(60.0, 2.5 * z))),
+    'sin': lambda z: math.sin(max(-60.0, min(60.0, 5.0 * z))),
+    'gauss': lambda z: math.exp(-5.0 * max(-3.4, min(3.4, z)) ** 2),
+    'relu': lambda z: z if z > 0.0 else 0.0,
+    'softplus': lambda z: 0.2 * math.log(1 + math.exp(max(-60.0, min(60.0, 5.0 * z)))),
+    'identity': lambda z: z,
+    'clamped': lambda z: max(-1.0, min(1.0, z)),
+    'abs': abs,
+    'hat': lambda z: max(0.0, 1 - abs(z)),
+    'square': lambda z: z ** 2,
+    'cube': lambda z: z ** 3
+}
+
+# The activation of a node is stored as its index here, so new ones can only be added at the end
+ACTIVATION_NAMES = ('sigmoid', 'tanh', 'sin', 'gauss', 'relu', 'softplus', 'identity', 'clamped', 'abs', 'hat', 'square', 'cube')
+
+def arrayLength(counts, length):
+    """
+    The length of an array given as a header count, optionally plus one, like 'nodeCount+1'.
+    """
+    name, _, extra = length.partition('+')
+    return counts[name] + int(extra or 0)
+
+def policyBytes(arrays, inputCount, slotCount, genomeKey=-1, fitness=float('nan'), decisionInterval=1, decisionEvents=False):
+    """
+    Encode a network given as the POLICY_ARRAYS 'arrays' as the contents of a policy file.
+    """
+    counts = {
+        'outputCount': len(arrays['outputSlots']),
+        'layerCount': len(arrays['layerFanIn']),
+        'nodeCount': len(arrays['nodeSlots']),
+        'linkCount': len(arrays['linkSources'])
+    }
+    parts = [POLICY_HEADER.pack(POLICY_MAGIC, POLICY_VERSION, genomeKey, fitness, inputCount, counts['outputCount'], slotCount,
+                                counts['nodeCount'], counts['linkCount'], counts['layerCount'], decisionInterval, int(decisionEvents))]
+    size = POLICY_HEADER.size
+    for name, dtype, length in POLICY_ARRAYS:
+        parts.append(bytes(-size % POLICY_ALIGNMENT))
+        data = np.asarray(arrays[name], dtype=dtype)
+        if len(data) != arrayLength(counts, length):
+            raise ValueError(f"Policy array {name} has {len(data)} entries instead of {length}")
+        parts.append(data.tobytes())
+        size += len(parts[-2]) + len(parts[-1])
+    return b"".join(parts)
+
+def savePolicy(path, arrays, inputCount, slotCount, genomeKey=-1, fitness=float('nan'), decisionInterval=1, decisionEvents=False):
+    """
+    Write a policy file, see policyBytes.
+    """
+    with open(path, "wb") as output:
+        output.write(policyBytes(arrays, inputCount, slotCount, genomeKey, fitness, decisionInterval, decisionEvents))
+
+def loadPolicy(path):
+    """
+    Read a policy file into a Policy.
+    """
+    with open(path, "rb") as policyFile:
+        return Policy(policyFile.read())
+
+class Policy:
+    """
+    A feed-forward network read from the contents of a policy file. The arrays are views into 'data'.
+    For a batch its outputs are the same as those of main.activateNetworks for the network it was
+    exported from, and for one observation the same as those of neat's FeedForwardNetwork.
+    'decisionInterval' and 'decisionEvents' are None for version 1 files, which did not record them.
+    """
+    def __init__(self, data):
+        if len(data) < POLICY_HEADER_V1.size or data[:len(POLICY_MAGIC)] != POLICY_MAGIC:
+            raise ValueError("Not a policy file")
+        version = POLICY_HEADER_V1.unpack_from(data)[1]
+        if version == 1:
+            header = POLICY_HEADER_V1
+            self.decisionInterval = self.decisionEvents = None
+        elif version == POLICY_VERSION and len(data) >= POLICY_HEADER.size:
+            header = POLICY_HEADER
+        else:
+            raise ValueError(f"This is a version {version} policy file, the runtime reads versions 1 to {POLICY_VERSION}")
+        fields = header.unpack_from(data)
+        (_, _, self.genomeKey, self.fitness, self.inputCount, outputCount, self.slotCount,
+         nodeCount, linkCount, layerCount) = fields[:10]
+        if version == POLICY_VERSION:
+            self.decisionInterval = fields[10]
+            self.decisionEvents = bool(fields[11])
+        counts = {'outputCount': outputCount, 'nodeCount': nodeCount, 'linkCount': linkCount, 'layerCount': layerCount}
+
+        arrays = {}
+        offset = header.size
+        for name, dtype, length in POLICY_ARRAYS:
+            offset += -offset % POLICY_ALIGNMENT
+            arrays[name] = np.frombuffer(data, dtype=dtype, count=arrayLength(counts, length), offset=offset)
+            offset += arrays[name].nbytes
+        self.outputSlots = arrays['outputSlots']
+
+        self.layers = []
+        self.nodes = []
+        linkStart = 0
+        layerStarts = arrays['layerStarts'].tolist()
+        for start, end, fanIn, code in zip(layerStarts[:-1], layerStarts[1:], arrays['layerFanIn'].tolist(), arrays['layerActivation'].tolist()):
+            linkEnd = linkStart + fanIn * (end - start)
+            if code == MIXED_ACTIVATIONS:
+                codes = arrays['activation'][start:end]
+                activations = [(ACTIVATIONS[ACTIVATION_NAMES[nodeCode]], np.flatnonzero(codes == nodeCode)) for nodeCode in np.unique(codes)]
+            else:
+                activations = ACTIVATIONS[ACTIVATION_NAMES[code]]
+            self.layers.append((arrays['nodeSlots'][start:end], arrays['bias'][start:end], arrays['response'][start:end], fanIn,
+                                arrays['linkSources'][linkStart:linkEnd], arrays['linkWeights'][linkStart:linkEnd], activations))
+            linkStart = linkEnd
+        self.outputList = self.outputSlots.tolist()
+        self.arrays = arrays
+
+    def nodeEvaluations(self):
+        """
+        The nodes as plain Python tuples of slot, bias, response, activation and links without the
+        padding, built the first time one observation is evaluated.
+        """
+        if not self.nodes:
+            arrays = self.arrays
+            layerStarts = arrays['layerStarts'].tolist()
+            sources = arrays['linkSources'].tolist()
+            weights = arrays['linkWeights'].tolist()
+            linkStart = 0
+            for start, end, fanIn in zip(layerStarts[:-1], layerStarts[1:], arrays['layerFanIn'].tolist()):
+                width = end - start
+                for column, node in enumerate(range(start, end)):
+                    links = [(sources[linkStart + row * width + column], weights[linkStart + row * width + column]) for row in range(fanIn)]
+                    self.nodes.append((int(arrays['nodeSlots'][node]), float(arrays['bias'][node]), float(arrays['response'][node]),
+                                       SCALAR_ACTIVATIONS[ACTIVATION_NAMES[arrays['activation'][node]]],
+                                       [(source, weight) for source, weight in links if source != self.slotCount]))
+                linkStart += fanIn * width
+        return self.nodes
+
+    def activateOne(self, inputs):
+        """
+        Evaluate the network for one observation given as a sequence of floats, returning its outputs
+        as a list. This skips NumPy, which is faster for the small networks the game evolves.
+        """
+        if len(inputs) != self.inputCount:
+            raise ValueError(f"Expected {self.inputCount} inputs, got {len(inputs)}")
+        values = [0.0] * (self.slotCount + 1)
+        values[:self.inputCount] = inputs
+        for slot, bias, response, activation, links in self.nodes or self.nodeEvaluations():
+            total = 0
+            for source, weight in links:
+                total += values[source] * weight
+            values[slot] = activation(bias + response * total)
+        return [values[slot] for slot in self.outputList]
+
+    def activate(self, inputs):
+        """
+        Evaluate the network for one observation, giving its outputs, or for a batch of observations,
+        one row per game, giving one row of outputs per game.
+        """
+        inputs = np.asarray(inputs, dtype=float)
+        if inputs.ndim == 1:
+            return np.array(self.activateOne(inputs.tolist()))
+        batch = inputs.reshape(-1, self.inputCount)
+        values = np.zeros((len(batch), self.slotCount + 1))
+        values[:, :self.inputCount] = batch
+        for slots, bias, response, fanIn, sources, weights, activations in self.layers:
+            # Accumulating adds the links of every node one by one in order, which a sum might not
+            terms = (values[:, sources] * weights).reshape(len(batch), fanIn, len(slots))
+            sums = np.add.accumulate(terms, axis=1)[:, -1] if fanIn else 0.0
+            total = bias + response * sums
+            if callable(activations):
+                total = activations(total)
+            else:
+                for activation, nodeIndices in activations:
+                    total[:, nodeIndices] = activation(total[:, nodeIndices])
+            values[:, slots] = total
+        outputs = values[:, self.outputSlots]
+        return outputs
@@ -0,0 +1,125 @@
+"""
+Replay files, the recorded ticks of training episodes written by main.py's ReplayReporter and
+watched with 'python main.py --mode replay'.
+
+A replay file holds the state of some birds after every tick of one episode, column by column:
+an 8 byte magic, the header length as a little endian uint32, a JSON header with the metadata
+and the dtype, shape and offset of every column, and then the raw columns, each one aligned so
+loadReplay can map it straight from the file. Only NumPy is needed to read one:
+
+    import replay
+    metadata, columns = replay.loadReplay("replays/generation-0042.replay")
+"""
+import json
+import os
+
+import numpy as np
+
+REPLAY_MAGIC = b"FBREPLAY"
+REPLAY_VERSION = 1
+REPLAY_ALIGNMENT = 64
+
+# Walls kept per tick; walls are 400 pixels apart, so no more than 3 are ever on screen
+REPLAY_WALL_SLOTS = 4
+
+# Bits of the 'flags' column
+REPLAY_ALIVE = 1
+REPLAY_WIND_ACTIVE = 2
+REPLAY_HIGH_JUMP_ACTIVE = 4
+REPLAY_JUMP = 8
+REPLAY_HIGH_JUMP = 16
+
+class ReplayRecorder:
+    """
+    Collects what FlappyEnv draws after every tick: the y, tilt, image, wind timer, state flags
+    and actions of each bird, the score, the walls and the ground. Pass it to main.FlappyEnv as
+    'recorder' and turn it into replay columns with columns().
+    """
+    def __init__(self):
+        self.ticks = {'y': [], 'tilt': [], 'imageIndex': [], 'windTimer': [], 'flags': [], 'score': [], 'walls': [], 'ground': []}
+
+    def record(self, env, actions):
+        """
+        Record the state of 'env' after a tick played with 'actions'.
+        """
+        population = env.population
+        self.ticks['y'].append(population['y'].astype(np.float32))
+        self.ticks['tilt'].append(population['tilt'].astype(np.int16))
+        self.ticks['imageIndex'].append(population['imageIndex'].astype(np.uint8))
+        self.ticks['windTimer'].append(population['windTimer'].astype(np.int16))
+        self.ticks['flags'].append((population['alive'] * REPLAY_ALIVE | population['windActive'] * REPLAY_WIND_ACTIVE |
+                                    population['highJumpActive'] * REPLAY_HIGH_JUMP_ACTIVE | actions[:, 0] * REPLAY_JUMP |
+                                    actions[:, 1] * REPLAY_HIGH_JUMP).astype(np.uint8))
+        self.ticks['score'].append(env.score)
+        walls = np.full((REPLAY_WALL_SLOTS, 2), -1, dtype=np.int16)
+        for slot, wall in enumerate(env.walls[:REPLAY_WALL_SLOTS]):
+            walls[slot] = (wall['x'], wall['height'])
+        self.ticks['walls'].append(walls)
+        self.ticks['ground'].append((env.Ground['x1'], env.Ground['x2']))
+
+    def columns(self, birdIndices=None):
+        """
+        Get the recording as replay columns with one row per tick, keeping only the birds in 'birdIndices'.
+        """
+        birdIndices = slice(None) if birdIndices is None else birdIndices
+        columns = {}
+        for name in ('y', 'tilt', 'imageIndex', 'windTimer', 'flags'):
+            columns[name] = np.array(self.ticks[name])[:, birdIndices]
+        columns['score'] = np.array(self.ticks['score'], dtype=np.int32)
+        columns['walls'] = np.array(self.ticks['walls'], dtype=np.int16).reshape(-1, REPLAY_WALL_SLOTS, 2)
+        columns['ground'] = np.array(self.ticks['ground'], dtype=np.int16).reshape(-1, 2)
+        return columns
+
+def saveReplay(path, metadata, columns):
+    """
+    Write a replay file with the 'metadata' dict and the NumPy arrays in 'columns'.
+    """
+    header = {'version': REPLAY_VERSION, 'metadata': metadata, 'columns': []}
+    offset = 0
+    for name, column in columns.items():
+        header['columns'].append({'name': name, 'dtype': column.dtype.str, 'shape': column.shape, 'offset': offset})
+        offset += -(-column.nbytes // REPLAY_ALIGNMENT) * REPLAY_ALIGNMENT
+    headerBytes = json.dumps(header).encode()
+    dataStart = -(-(len(REPLAY_MAGIC) + 4 + len(headerBytes)) // REPLAY_ALIGNMENT) * REPLAY_ALIGNMENT
+    headerBytes += b" " * (dataStart - len(REPLAY_MAGIC) - 4 - len(headerBytes))
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "wb") as output:
+        output.write(REPLAY_MAGIC)
+        output.write(len(headerBytes).to_bytes(4, "little"))
+        output.write(headerBytes)
+        for name, column in columns.items():
+            data = np.ascontiguousarray(column).tobytes()
+            output.write(data)
+            output.write(bytes(-len(data) % REPLAY_ALIGNMENT))
+
+def loadReplay(path):
+    """
+    Open a replay file. Returns its metadata and its columns, which are memory mapped from the file.
+    """
+    with open(path, "rb") as replayFile:
+        if replayFile.read(len(REPLAY_MAGIC)) != REPLAY_MAGIC:
+            raise ValueError(f"{path} is not a replay file")
+        headerLength = int.from_bytes(replayFile.read(4), "little")
+        header = json.loads(replayFile.read(headerLength))
+    if header['version'] != REPLAY_VERSION:
+        raise ValueError(f"{path} is a version {header['version']} replay, this game reads version {REPLAY_VERSION}")
+    dataStart = len(REPLAY_MAGIC) + 4 + headerLength
+    columns = {}
+    for column in header['columns']:
+        shape = tuple(column['shape'])
+        if np.prod(shape) == 0:
+            columns[column['name']] = np.zeros(shape, dtype=column['dtype'])
+        else:
+            columns[column['name']] = np.memmap(path, dtype=column['dtype'], mode='r', offset=dataStart + column['offset'], shape=shape)
+    return header['metadata'], columns
+
+def listReplays(directory):
+    """
+    Get the paths of the replays in 'directory', oldest generation first.
+    """
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.endswith(".replay")]
@@ -0,0 +1,234 @@
+"""
+Speciation for NEAT populations of thousands of genomes, selected with 'species_set = vectorized'
+in the [FlappyBird] section of ConfigFile.txt.
+
+VectorizedSpeciesSet is a drop-in neat.DefaultSpeciesSet that computes the genome distances with
+NumPy and gives the same species; only neat-python and NumPy are needed.
+"""
+import neat
+import numpy as np
+
+def buildGeneTable(geneDicts, floatNames, otherNames):
+    """
+    Encode the node or connection genes of several genomes ('geneDicts') as sparse arrays of gene ids,
+    float attributes and ids of the other attributes, since only whether those are equal counts towards
+    the distance, and spread them into dense genome by gene matrices over the genes present.
+    Each genome's gene columns are kept in its own order.
+    """
+    geneIds = {}
+    valueIds = {}
+    genes = [gene for geneDict in geneDicts for gene in geneDict.values()]
+    counts = np.array([len(geneDict) for geneDict in geneDicts])
+    rows = np.repeat(np.arange(len(geneDicts)), counts)
+    columns = np.array([geneIds.setdefault(key, len(geneIds)) for geneDict in geneDicts for key in geneDict], dtype=np.int64)
+
+    shape = (len(geneDicts), len(geneIds))
+    present = np.zeros(shape, dtype=bool)
+    present[rows, columns] = True
+    floats = np.zeros((len(floatNames),) + shape)
+    floats[:, rows, columns] = [[getattr(gene, name) for gene in genes] for name in floatNames]
+    others = np.zeros((len(otherNames),) + shape, dtype=np.int64)
+    others[:, rows, columns] = [[valueIds.setdefault(getattr(gene, name), len(valueIds)) for gene in genes] for name in otherNames]
+    return {'counts': counts, 'columns': np.split(columns, np.cumsum(counts)[:-1]), 'present': present, 'floats': floats, 'others': others}
+
+def geneTableDistances(table, representativeRow, rows, disjointCoefficient, weightCoefficient):
+    """
+    The node or connection part of DefaultGenome.distance from the genome at 'representativeRow' of 'table'
+    to each genome of 'rows', with the same float operations in the same order, so the results are equal to the bit.
+    """
+    columns = table['columns'][representativeRow]
+    counts = table['counts'][rows]
+    homologous = np.zeros(len(rows))
+    common = 0
+    if len(columns):
+        grid = np.ix_(rows, columns)
+        present = table['present'][grid]
+        terms = np.zeros(present.shape)
+        for values in table['floats']:
+            terms += np.abs(values[representativeRow, columns] - values[grid])
+        for values in table['others']:
+            terms += values[representativeRow, columns] != values[grid]
+        terms *= weightCoefficient
+        terms[~present] = 0.0
+        # The genome adds up its homologous genes one by one, which cumsum does too
+        homologous = np.cumsum(terms, axis=1)[:, -1]
+        common = present.sum(axis=1)
+
+    largest = np.maximum(counts, len(columns))
+    distances = np.zeros(len(rows))
+    genes = largest > 0
+    disjoint = counts + len(columns) - 2 * common
+    distances[genes] = (homologous[genes] + disjointCoefficient * disjoint[genes]) / largest[genes]
+    return distances
+
+class VectorizedSpeciesSet(neat.DefaultSpeciesSet):
+    """
+    neat.DefaultSpeciesSet that computes the genome distances with NumPy, from every representative
+    to all the genomes it is compared with at once, instead of one pair at a time. It makes the same
+    comparisons in the same order with the same distances, so the species come out the same.
+    Each generation the genomes are encoded as sparse gene arrays, and since neat never changes a genome
+    once it has a key, the distances from each representative are kept while both genomes are alive.
+    Select it with 'species_set = vectorized'; it reads the [DefaultSpeciesSet] section like neat's.
+    """
+    def __init__(self, config, reporters):
+        super().__init__(config, reporters)
+        self.clearCaches()
+
+    def clearCaches(self):
+        """
+        Forget the gene arrays and distances, which are rebuilt from the genomes when needed.
+        """
+        self.known = {}
+        self.tables = None
+        self.rows = {}
+        self.slots = None
+        self.columns = []
+        self.newDistances = []
+
+    def __getstate__(self):
+        # Checkpoints leave the caches out
+        state = dict(self.__dict__)
+        for name in ('known', 'tables', 'rows', 'slots', 'columns', 'newDistances'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.clearCaches()
+
+    def prepare(self, genomeConfig, population):
+        """
+        Build the gene tables of the population and the current representatives, and drop the
+        distances of genomes that are gone.
+        """
+        genomes = dict(population)
+        for species in self.species.values():
+            genomes.setdefault(species.representative.key, species.representative)
+
+        self.known = {key: {otherKey: distance for otherKey, distance in distances.items() if otherKey in genomes}
+                      for key, distances in self.known.items() if key in genomes}
+        self.rows = {key: row for row, key in enumerate(genomes)}
+        self.tables = [buildGeneTable([genome.nodes for genome in genomes.values()], ('bias', 'response'), ('activation', 'aggregation')),
+                       buildGeneTable([genome.connections for genome in genomes.values()], ('weight',), ('enabled',))]
+        self.coefficients = (genomeConfig.compatibility_disjoint_coefficient, genomeConfig.compatibility_weight_coefficient)
+        self.slots = np.full(len(genomes), -1)
+        self.columns = []
+        self.newDistances = []
+
+    def distanceColumn(self, representative, keys):
+        """
+        The distances from 'representative' to the genomes 'keys'. Like in GenomeDistanceCache a distance
+        taken earlier this generation is reused, in either direction, then one kept from an earlier
+        generation, and the rest are computed in one go.
+        """
+        representativeKey = representative.key
+        representativeRow = self.rows[representativeKey]
+        rows = np.array([self.rows[key] for key in keys], dtype=np.int64)
+        column = np.full(len(rows), np.nan)
+        # 'slots' maps a row to its index in this column while the column is filled
+        self.slots[rows] = np.arange(len(rows))
+
+        for otherRow, otherRows, otherColumn in self.columns:
+            if otherRow == representativeRow:
+                indices = self.slots[otherRows]
+                column[indices[indices >= 0]] = otherColumn[indices >= 0]
+            elif self.slots[otherRow] >= 0:
+                matches = np.flatnonzero(otherRows == representativeRow)
+                if len(matches):
+                    column[self.slots[otherRow]] = otherColumn[matches[0]]
+        new = np.isnan(column)
+
+        known = self.known.setdefault(representativeKey, {})
+        for key, distance in known.items():
+            index = self.slots[self.rows[key]]
+            if index >= 0 and new[index]:
+                column[index] = distance
+
+        missing = np.flatnonzero(np.isnan(column))
+        if len(missing):
+            computed = sum(geneTableDistances(table, representativeRow, rows[missing], *self.coefficients) for table in self.tables)
+            column[missing] = computed
+            known.update(zip([keys[index] for index in missing], computed.tolist()))
+
+        self.slots[rows] = -1
+        self.columns.append((representativeRow, rows, column))
+        # GenomeDistanceCache holds a distance under both orders of the pair, and once for a genome with itself
+        self.newDistances.append((column[new], np.where(rows[new] == representativeRow, 1, 2)))
+        return column
+
+    def speciate(self, config, population, generation):
+        """
+        Place genomes into species by genetic similarity, exactly like DefaultSpeciesSet.speciate.
+        """
+        assert isinstance(population, dict)
+
+        compatibility_threshold = self.species_set_config.compatibility_threshold
+        self.prepare(config.genome_config, population)
+
+        # Built from the keys like the default, so the set is iterated in the same order
+        unspeciated = set(population.keys())
+        new_representatives = {}
+        new_members = {}
+        for sid, s in self.species.items():
+            # The new representative is the genome closest to the current representative.
+            keys = list(unspeciated)
+            new_rid = keys[int(np.argmin(self.distanceColumn(s.representative, keys)))]
+            new_representatives[sid] = new_rid
+            new_members[sid] = [new_rid]
+            unspeciated.remove(new_rid)
+
+        # Each representative's distances to the genomes still unspeciated when it became one, in
+        # the order of 'representatives'. A genome is compared with the representatives of the time it is popped.
+        positions = {gid: position for position, gid in enumerate(unspeciated)}
+        representatives = []
+        columns = np.full((len(positions), max(len(new_representatives), 16)), np.inf)
+
+        def addRepresentative(sid, rid):
+            nonlocal columns
+            if len(representatives) == columns.shape[1]:
+                columns = np.hstack((columns, np.full(columns.shape, np.inf)))
+            keys = list(unspeciated)
+            columns[[positions[gid] for gid in keys], len(representatives)] = self.distanceColumn(population[rid], keys)
+            representatives.append((sid, rid))
+
+        for sid, rid in new_representatives.items():
+            addRepresentative(sid, rid)
+
+        # Partition population into species based on genetic similarity.
+        while unspeciated:
+            gid = unspeciated.pop()
+
+            # Find the species with the most similar representative.
+            distances = columns[positions[gid], :len(representatives)]
+            candidates = np.flatnonzero(distances < compatibility_threshold)
+            if len(candidates):
+                sid = representatives[candidates[np.argmin(distances[candidates])]][0]
+                new_members[sid].append(gid)
+            else:
+                # No species is similar enough, create a new species, using
+                # this genome as its representative.
+                sid = next(self.indexer)
+                new_representatives[sid] = gid
+                new_members[sid] = [gid]
+                addRepresentative(sid, gid)
+
+        # Update species collection based on new speciation.
+        self.genome_to_species = {}
+        for sid, rid in new_representatives.items():
+            s = self.species.get(sid)
+            if s is None:
+                s = neat.species.Species(sid, generation)
+                self.species[sid] = s
+
+            members = new_members[sid]
+            for gid in members:
+                self.genome_to_species[gid] = sid
+
+            member_dict = dict((gid, population[gid]) for gid in members)
+            s.update(population[rid], member_dict)
+
+        distances, weights = (np.concatenate(arrays) for arrays in zip(*self.newDistances))
+        gdmean = np.average(distances, weights=weights)
+        gdstdev = np.sqrt(np.average((distances - gdmean) ** 2, weights=weights))
+        self.reporters.info(
+            'Mean genetic distance {0:.3f}, standard deviation {1:.3f}'.format(gdmean, gdstdev))